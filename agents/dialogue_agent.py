@@ -1,5 +1,8 @@
-﻿import re
-from typing import Tuple, Literal, Dict, Any, Optional
+﻿import os, re
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Tuple, Literal, Dict, Any, Mapping, Optional
+from utils.matcher import AhoCorasick
 
 Intent = Literal["facts", "itinerary", "help", "chitchat", "unknown"]
 
@@ -27,6 +30,19 @@ CHITCHAT_TRIGGERS = (
     "how are you", "what's up", "whats up", "good afternoon", "greetings"
 )
 
+HELP_TRIGGERS = ("help", "how to use", "what can you do")
+
+# every trigger family in one automaton: one scan tells which families occur
+TRIGGERS = AhoCorasick(
+    [(k, "help") for k in HELP_TRIGGERS]
+    + [(k, "itinerary") for k in PLAN_TRIGGERS]
+    + [(k, "facts") for k in FACTS_TRIGGERS]
+    + [(k, "chitchat") for k in CHITCHAT_TRIGGERS]
+)
+
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "4096"))
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+
 def parse_minutes(text: str) -> Optional[int]:
     t = (text or "").lower()
     m = TIME_PAT.search(t)
@@ -50,36 +66,101 @@ def _extract_city(text: str) -> Optional[str]:
         return " ".join(words).title() if words else None
     return None
 
-def route_intent(text: str) -> Tuple[Intent, Dict[str, Any]]:
-    t = (text or "").lower().strip()
+def route_intent(text: str) -> Tuple[Intent, Mapping[str, Any]]:
+    """Classify a (sanitized) message. Results are memoized per message, so the
+    payload is a read-only mapping; copy it with dict() before changing it."""
+    return _route(text or "")
+
+@lru_cache(maxsize=ROUTE_CACHE_SIZE)
+def _route(text: str) -> Tuple[Intent, Mapping[str, Any]]:
+    t = text.lower().strip()
+    found = TRIGGERS.values(t)
 
     # Help
-    if any(k in t for k in ("help", "how to use", "what can you do")):
-        return "help", {}
+    if "help" in found:
+        return "help", _EMPTY
 
     # Itinerary first (because “plan about kandy” should be itinerary)
-    if any(k in t for k in PLAN_TRIGGERS):
-        return "itinerary", {
+    if "itinerary" in found:
+        return "itinerary", MappingProxyType({
             "city": _extract_city(text),
             "minutes": parse_minutes(text)
-        }
+        })
 
     # Facts
-    if any(k in t for k in FACTS_TRIGGERS):
+    if "facts" in found:
         # try to grab the substring after "about"
         place = None
         if "about" in t:
             place = text.lower().split("about", 1)[1]
         place = (place or text).strip(" ?!.")
-        return "facts", {"place": place}
+        return "facts", MappingProxyType({"place": place})
 
     # Chit-chat / greetings
-    if any(k in t for k in CHITCHAT_TRIGGERS):
-        return "chitchat", {}
+    if "chitchat" in found:
+        return "chitchat", _EMPTY
 
     # One or two words → treat as place facts (e.g., "Sigiriya", "Kandy ticket")
     words = [w for w in re.split(r"\s+", t) if w]
     if 1 <= len(words) <= 3:
-        return "facts", {"place": text.strip(" ?!.")}
+        return "facts", MappingProxyType({"place": text.strip(" ?!.")})
+
+    return "unknown", _EMPTY
+
+def route_cache_info() -> Dict[str, Any]:
+    info = _route.cache_info()
+    total = info.hits + info.misses
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize,
+            "hit_rate": round(info.hits / total, 4) if total else 0.0}
+
+def facts_reply(res: Mapping[str, Any]) -> str:
+    """Markdown reply for an `ir_agent.lookup_place` result."""
+    facts = "\n- " + "\n- ".join(res["facts"]) if res["facts"] else "No facts."
+    return (
+        f"**{res['place']}**{facts}\n\n"
+        f"**Ticket:** {res['ticket']}\n\n"
+        f"Would you like a 2–3 stop **mini tour** in **{res['place']}**? "
+        f"Tell me your time (e.g., *2 hours*)."
+    )
+
+def itinerary_reply(res: Mapping[str, Any], closing: str) -> str:
+    """Markdown reply for an `itinerary_agent.plan` result, followed by `closing`."""
+    lines = [f"{i+1}. {s['name']} — ~{s['minutes']} min"
+             + (f" (+{s['travel_minutes']} min travel)" if s.get("travel_minutes") else "")
+             for i, s in enumerate(res["stops"])]
+    return (
+        f"**{res['city']} — {res['planned_minutes']}/{res['total_minutes']} min**\n"
+        + "\n".join(lines)
+        + "\n\n" + closing
+    )
+
+# ---------- template rendering: structured results straight to final Markdown ----------
+# intents whose replies skip polish_text (comma list; empty = polish everything)
+RENDER_INTENTS = frozenset(i.strip() for i in os.getenv("RENDER_INTENTS", "facts,itinerary").split(",") if i.strip())
+
+class Rendered(str):
+    """Reply text that is already final: callers send it without `polish_text`."""
+
+def renders(intent: str) -> bool:
+    return intent in RENDER_INTENTS
+
+# compiled once; same shape the polish prompt asks for (lead sentence, then bullets / numbered stops)
+_FACTS = "**{place}**: {lead}\n{bullets}- **Ticket:** {ticket}\n\n{offer}".format
+_FACTS_OFFER = "Want a 2–3 stop **mini tour** of **{}**? Tell me your time (e.g., *2 hours*).".format
+_STOP = "{}. **{}** — ~{} min{}".format
+_TRAVEL = " (+{} min travel)".format
+_ITINERARY = "Here is a **{}-minute** plan for **{}** ({} min available):\n{}\n\n{}".format
+
+def render_facts(res: Mapping[str, Any]) -> Rendered:
+    """Final Markdown for an `ir_agent.lookup_place` result."""
+    facts = res["facts"]
+    return Rendered(_FACTS(
+        place=res["place"], lead=facts[0] if facts else "No facts yet.",
+        bullets="".join(f"- {f}\n" for f in facts[1:]), ticket=res["ticket"],
+        offer=_FACTS_OFFER(res["place"])))
 
-    return "unknown", {}
+def render_itinerary(res: Mapping[str, Any], closing: str) -> Rendered:
+    """Final Markdown for an `itinerary_agent.plan` result, followed by `closing`."""
+    stops = "\n".join(_STOP(i, s["name"], s["minutes"], _TRAVEL(s["travel_minutes"]) if s.get("travel_minutes") else "")
+                      for i, s in enumerate(res["stops"], 1))
+    return Rendered(_ITINERARY(res["planned_minutes"], res["city"], res["total_minutes"], stops, closing))
@@ -1,72 +1,269 @@
-﻿import json, os, difflib, re
-from typing import Optional, Dict, List
-
-DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "places.json")
-with open(DATA_PATH, "r", encoding="utf-8-sig") as f:
-    PLACES: Dict[str, dict] = json.load(f)
+﻿import difflib, os, re, math, heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from typing import Optional, Dict, List, Tuple
+from utils import catalogue
+from utils.catalogue import Catalogue
+from utils.matcher import AhoCorasick
 
 def list_places() -> List[str]:
-    return sorted(list(PLACES.keys()))
+    return list(catalogue.list_names())
 
 def _norm(s: str) -> str:
     return re.sub(r"[^a-z0-9]+", " ", (s or "").lower()).strip()
 
-def _best_match(q: str) -> Optional[str]:
-    if not q: return None
-    qn = _norm(q)
-    # exact / substring match on keys and aliases
-    for name, data in PLACES.items():
-        keys = [name] + data.get("aliases", [])
-        for k in keys:
-            kn = _norm(k)
-            if qn == kn or qn in kn or kn in qn:
-                return name
-    # fuzzy
-    candidates = difflib.get_close_matches(qn, [_norm(k) for k in PLACES.keys()], n=1, cutoff=0.6)
-    if candidates:
-        # map back to original casing
-        lower_to_orig = {_norm(k): k for k in PLACES.keys()}
-        return lower_to_orig.get(candidates[0])
-    return None
+class PlaceIndex:
+    """Name/alias lookup structures for `_best_match`, built once per catalogue.
+
+    Places are ranked in catalogue order; the first place with a name or alias
+    that equals, contains or is contained in the query wins, like the original
+    linear scan. Keys and queries with nothing left after normalizing match
+    nothing (the scan let "" match everything). Otherwise difflib picks the
+    closest place name.
+    """
+
+    def __init__(self, places: Catalogue):
+        self.names: List[str] = list(places)
+        self.exact: Dict[str, int] = {}      # normalized key -> first rank
+        keys: List[str] = []
+        self._starts: List[int] = []         # offset of each key inside the blob
+        self._ranks: List[int] = []
+        offset = 0
+        for rank, (name, data) in enumerate(places.items()):
+            for k in (name,) + data.aliases:
+                kn = _norm(k)
+                if not kn:
+                    continue
+                self.exact.setdefault(kn, rank)
+                keys.append(kn)
+                self._starts.append(offset)
+                self._ranks.append(rank)
+                offset += len(kn) + 1
+        # "query in key": first hit in the newline-joined keys is the lowest rank
+        self._blob = "\n".join(keys)
+        # "key in query": every key found in one pass over the query
+        self._contained = AhoCorasick((kn, r) for kn, r in zip(keys, self._ranks))
+        # fuzzy candidates, same list/mapping the scan used to rebuild per miss
+        self.fuzzy_keys = [_norm(k) for k in places]
+        self.fuzzy_orig = {kn: k for kn, k in zip(self.fuzzy_keys, places)}
+
+    def best_match(self, q: str) -> Optional[str]:
+        if not q: return None
+        qn = _norm(q)
+        if not qn:
+            return None
+        best = self.exact.get(qn)
+        # anything matching must rank before the current best
+        i = bisect_left(self._ranks, best) if best is not None else len(self._ranks)
+        end = self._starts[i] if i < len(self._starts) else len(self._blob)
+        if self._starts:
+            pos = self._blob.find(qn, 0, end)
+            if pos >= 0:
+                rank = self._ranks[bisect_right(self._starts, pos) - 1]
+                if best is None or rank < best:
+                    best = rank
+        for _, rank in self._contained.finditer(qn):
+            if best is None or rank < best:
+                best = rank
+        if best is not None:
+            return self.names[best]
+        candidates = difflib.get_close_matches(qn, self.fuzzy_keys, n=1, cutoff=0.6)
+        if candidates:
+            return self.fuzzy_orig.get(candidates[0])
+        return None
+
+catalogue.register_index("ir.place_index", PlaceIndex, version=2)
+
+def _best_match(q: str, cat: Optional[Catalogue] = None) -> Optional[str]:
+    return (cat or catalogue.get()).derived("ir.place_index", PlaceIndex).best_match(q)
 
 def lookup_place(place: str) -> Optional[dict]:
-    name = _best_match(place)
+    cat = catalogue.get()   # one snapshot per call, even if a reload swaps it meanwhile
+    name = _best_match(place, cat)
     if not name:
         return None
-    e = PLACES[name]
-    facts = e.get("facts", [])
-    ticket = e.get("ticket", "N/A")
+    e = cat[name]
+    ticket = e.ticket if e.ticket is not None else "N/A"
     return {
         "place": name,
-        "facts": facts[:5],  # show a few more facts
+        "facts": list(e.facts[:5]),  # show a few more facts
         "ticket": ticket
     }
 
+class SearchIndex:
+    """BM25 inverted index over name, city, highlights and facts, built once per catalogue."""
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, places: Catalogue):
+        self.docs: List[dict] = []
+        self.postings: Dict[str, List[tuple]] = {}   # token -> [(doc_id, tf weight), ...]
+        term_freqs: List[Dict[str, int]] = []
+        lengths: List[int] = []
+        for name, data in places.items():
+            fields = [
+                name,
+                data.city,
+                " ".join(data.highlights),
+                " ".join(data.facts),
+            ]
+            tokens = _norm(" ".join(fields)).split()
+            tf: Dict[str, int] = {}
+            for tok in tokens:
+                tf[tok] = tf.get(tok, 0) + 1
+            term_freqs.append(tf)
+            lengths.append(len(tokens))
+            self.docs.append({"name": name, "city": data.city, "best_time": data.best_time})
+        n_docs = len(self.docs)
+        avgdl = (sum(lengths) / n_docs) if n_docs else 0.0
+        k1, b = self.K1, self.B
+        # the BM25 tf component only depends on the document, so fold it into the postings
+        for doc_id, tf in enumerate(term_freqs):
+            norm = k1 * (1 - b + b * (lengths[doc_id] / avgdl if avgdl else 0.0))
+            for tok, n in tf.items():
+                self.postings.setdefault(tok, []).append((doc_id, n * (k1 + 1) / (n + norm)))
+        self.idf = {tok: math.log(1 + (n_docs - len(p) + 0.5) / (len(p) + 0.5)) for tok, p in self.postings.items()}
+
+    def search(self, query: str, k: int = 10) -> List[dict]:
+        scores: Dict[int, float] = {}
+        get = scores.get
+        for tok in set(_norm(query).split()):
+            postings = self.postings.get(tok)
+            if not postings:
+                continue
+            idf = self.idf[tok]
+            for doc_id, w in postings:
+                scores[doc_id] = get(doc_id, 0.0) + idf * w
+        # top-k via heap; ties keep catalogue order
+        top = heapq.nsmallest(k, scores.items(), key=lambda kv: (-kv[1], kv[0]))
+        return [{**self.docs[doc_id], "score": round(score, 4)} for doc_id, score in top]
+
+catalogue.register_index("ir.search_index", SearchIndex)
+
 def search(query: str) -> List[dict]:
-    """Lightweight search across name, city, highlights."""
-    qn = _norm(query)
-    results = []
-    for name, data in PLACES.items():
-        score = 0
-        fields = [
-            name,
-            data.get("city", ""),
-            " ".join(data.get("highlights", [])),
-            " ".join(data.get("facts", [])),
-        ]
-        joined = " ".join(fields).lower()
-        if qn in joined:
-            score += 3
-        # token overlap
-        tokens = set(qn.split())
-        if tokens and any(tok in joined for tok in tokens):
-            score += len(tokens)
-        if score:
-            results.append({
-                "name": name,
-                "city": data.get("city", ""),
-                "best_time": data.get("best_time", ""),
-                "score": score
-            })
-    results.sort(key=lambda x: x["score"], reverse=True)
-    return results[:10]
+    """Ranked (BM25) search across name, city, highlights and facts."""
+    return catalogue.get().derived("ir.search_index", SearchIndex).search(query)
+
+
+# ---------- similar places ----------
+SIMILAR_K = int(os.getenv("SIMILAR_K", "5"))                     # neighbours kept per place
+SIMILAR_MAX_DF = float(os.getenv("SIMILAR_MAX_DF", "0.2"))       # ignore terms in more than this share of places...
+SIMILAR_MAX_POSTINGS = int(os.getenv("SIMILAR_MAX_POSTINGS", "500"))  # ...or in more than this many
+SIMILAR_WORKERS = int(os.getenv("SIMILAR_WORKERS", "0"))         # processes for the neighbour table (0 = in-process)
+SIMILAR_BLOCK = 2000                                             # rows per task
+STOPWORDS = frozenset("""a an and are as at be by for from has have in is it its known of on or the
+    to was were with this that also very most more""".split())
+
+def _top_rows(start: int, stop: int, vectors, post_ids, post_w, k: int) -> List[list]:
+    """Top-k (doc id, cosine) for rows start..stop of the sparse product."""
+    rows = []
+    for i in range(start, stop):
+        scores: Dict[int, float] = {}
+        get = scores.get
+        for t, w in vectors[i]:
+            for j, wj in zip(post_ids[t], post_w[t]):
+                scores[j] = get(j, 0.0) + w * wj
+        scores.pop(i, None)
+        rows.append(heapq.nlargest(k, scores.items(), key=itemgetter(1)))
+    return rows
+
+_block_state: tuple = ()
+
+def _init_block_worker(state: tuple):
+    global _block_state
+    _block_state = state
+
+def _block_worker(bounds: Tuple[int, int]) -> List[list]:
+    return _top_rows(*bounds, *_block_state)
+
+class SimilarIndex:
+    """Top-k most similar places for every place, built once per catalogue.
+
+    Each place is a TF-IDF vector (sublinear tf, L2-normalized) over the words
+    of its facts, highlights and stop names. Cosine similarities come from a
+    sparse product over an inverted index, in row blocks (optionally on a
+    process pool); no dense matrix is formed. Terms found in only one place,
+    or in too many (SIMILAR_MAX_DF / SIMILAR_MAX_POSTINGS), are dropped, which
+    bounds the work per row. Only the neighbour table (ids and scores, `k`
+    per place) is kept, so a lookup is one slice.
+    """
+
+    def __init__(self, places: Catalogue, k: int = SIMILAR_K, max_df: float = SIMILAR_MAX_DF,
+                 max_postings: int = SIMILAR_MAX_POSTINGS, workers: int = SIMILAR_WORKERS):
+        self.k = k
+        self.names: List[str] = list(places)
+        self.rank = {name: i for i, name in enumerate(self.names)}
+        n = len(self.names)
+        docs: List[Dict[str, int]] = []
+        df: Dict[str, int] = {}
+        for data in (places[name] for name in self.names):
+            tf: Dict[str, int] = {}
+            for tok in _norm(" ".join(data.facts + data.highlights + data.stop_names)).split():
+                if len(tok) > 1 and tok not in STOPWORDS:
+                    tf[tok] = tf.get(tok, 0) + 1
+            docs.append(tf)
+            for tok in tf:
+                df[tok] = df.get(tok, 0) + 1
+        limit = max(2, min(int(max_df * n), max_postings))
+        terms = {tok: t for t, tok in enumerate(tok for tok, c in df.items() if 2 <= c <= limit)}
+        idf = [0.0] * len(terms)
+        for tok, t in terms.items():
+            idf[t] = math.log(n / df[tok])
+        post_ids = [array("i") for _ in terms]
+        post_w = [array("d") for _ in terms]
+        vectors: List[List[tuple]] = []
+        for doc_id, tf in enumerate(docs):
+            vec = [(terms[tok], (1 + math.log(c)) * idf[terms[tok]]) for tok, c in tf.items() if tok in terms]
+            norm = math.sqrt(sum(w * w for _, w in vec)) or 1.0
+            vec = [(t, w / norm) for t, w in vec]
+            vectors.append(vec)
+            for t, w in vec:
+                post_ids[t].append(doc_id)
+                post_w[t].append(w)
+        state = (vectors, post_ids, post_w, k)
+        blocks = [(a, min(a + SIMILAR_BLOCK, n)) for a in range(0, n, SIMILAR_BLOCK)]
+        if workers > 0 and len(blocks) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_block_worker,
+                                     initargs=(state,)) as pool:
+                rows = [row for block in pool.map(_block_worker, blocks) for row in block]
+        else:
+            rows = [row for a, b in blocks for row in _top_rows(a, b, *state)]
+        # flat table, -1 padded: row i holds place i's neighbours, best first
+        self.ids = array("i", [-1] * (n * k))
+        self.scores = array("f", [0.0] * (n * k))
+        for i, row in enumerate(rows):
+            for slot, (j, score) in enumerate(row):
+                self.ids[i * k + slot] = j
+                self.scores[i * k + slot] = score
+
+    def similar(self, name: str, k: Optional[int] = None) -> List[Tuple[str, float]]:
+        i = self.rank.get(name)
+        if i is None:
+            return []
+        base = i * self.k
+        out = []
+        for slot in range(base, base + min(k or self.k, self.k)):
+            j = self.ids[slot]
+            if j < 0:
+                break
+            out.append((self.names[j], round(self.scores[slot], 4)))
+        return out
+
+catalogue.register_index("ir.similar", SimilarIndex, config=(SIMILAR_K, SIMILAR_MAX_DF, SIMILAR_MAX_POSTINGS))
+
+def similar_places(place: str, k: int = 3) -> List[str]:
+    """Names of the places most like `place` (resolved like lookup_place), best first.
+
+    Empty until the neighbour table exists: it is built by the warm-up, on
+    reload or in the background, never inside the caller's request."""
+    cat = catalogue.get()
+    index = cat.peek("ir.similar", SimilarIndex)
+    if index is None:
+        return []
+    name = _best_match(place, cat)
+    if not name:
+        return []
+    return [n for n, _ in index.similar(name, k)]
@@ -1,50 +1,427 @@
-﻿import json, os, re
-from typing import Optional, Dict, List
-
-DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "places.json")
-with open(DATA_PATH, "r", encoding="utf-8-sig") as f:
-    PLACES: Dict[str, dict] = json.load(f)
-
-def _pick_city(city: str) -> Optional[str]:
-    cl = (city or "").lower()
-    for k in PLACES:
-        kl = k.lower()
-        if cl == kl or cl in kl or kl in cl:
-            return k
-    return None
-
-def _pack_stops(stops: List[dict], minutes: int) -> (List[dict], int):
-    """Greedy pack by minutes; keeps original order from dataset (already curated)."""
+﻿import os
+from array import array
+from bisect import bisect_right
+from math import gcd
+from typing import Optional, Dict, List, Tuple
+from utils import catalogue
+from utils.cache import TTLCache
+from utils.catalogue import Catalogue
+from utils.geo import TRAVEL_DETOUR, TRAVEL_SPEED_KMH, travel_matrix
+from utils.matcher import AhoCorasick
+
+# "auto" is "route" for cities whose stops all have coordinates, else "optimal"
+STRATEGIES = ("auto", "route", "optimal", "greedy")
+PLAN_STRATEGY = os.getenv("PLAN_STRATEGY", "auto")
+ROUTE_ROUNDS = int(os.getenv("ROUTE_ROUNDS", "8"))            # local-search passes per route
+ROUTE_SEEDS = int(os.getenv("ROUTE_SEEDS", "3"))              # extra starts from the most valuable stops
+PLAN_MAX_CELLS = int(os.getenv("PLAN_MAX_CELLS", "250000"))  # DP size cap (stops x minute buckets)
+PLAN_GRID_STEP = int(os.getenv("PLAN_GRID_STEP", "15"))       # budgets precomputed per city...
+PLAN_GRID_MAX = int(os.getenv("PLAN_GRID_MAX", "480"))        # ...up to this many minutes (0 = none)
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "4096"))   # plans for off-grid budgets
+MIN_MINUTES = 45
+
+class CityIndex:
+    """Resolves a free-text city to a catalogue key, built once per catalogue.
+
+    Same answer as scanning the catalogue in order for the first key that
+    equals, contains or is contained in the (lowercased) query, except that an
+    empty query or key matches nothing.
+    """
+
+    def __init__(self, places: Catalogue):
+        self.names: List[str] = list(places)
+        keys = [k.lower() for k in self.names]
+        self._starts: List[int] = []
+        offset = 0
+        for kl in keys:
+            self._starts.append(offset)
+            offset += len(kl) + 1
+        self._blob = "\n".join(keys)
+        self._contained = AhoCorasick((kl, i) for i, kl in enumerate(keys) if kl)
+
+    def resolve(self, city: str) -> Optional[str]:
+        if not self.names:
+            return None
+        cl = (city or "").lower()
+        if not cl:
+            return None
+        best = None
+        if "\n" not in cl:
+            # "query in key": first hit in the newline-joined keys is the earliest key
+            pos = self._blob.find(cl)
+            if pos >= 0:
+                best = bisect_right(self._starts, pos) - 1
+        for _, i in self._contained.finditer(cl):
+            if best is None or i < best:
+                best = i
+        return None if best is None else self.names[best]
+
+catalogue.register_index("itinerary.cities", CityIndex, version=2)
+
+def _pick_city(city: str, cat: Optional[Catalogue] = None) -> Optional[str]:
+    return (cat or catalogue.get()).derived("itinerary.cities", CityIndex).resolve(city)
+
+def _pack_stops(stops, minutes: int) -> (List[dict], int):
+    """Greedy pack by minutes; keeps original order from dataset (already curated).
+
+    `stops` yields (name, minutes) pairs, as from `Place.stops()`."""
     chosen: List[dict] = []
     used = 0
-    for s in stops:
-        dur = int(s.get("minutes", 30))
+    for name, dur in stops:
         if dur <= 0:
             continue
         if used + dur <= minutes:
-            chosen.append({"name": s.get("name", "Stop"), "minutes": dur})
+            chosen.append({"name": name or "Stop", "minutes": dur})
             used += dur
     return chosen, used
 
-def plan(city: str, minutes: int = 180) -> Optional[dict]:
-    minutes = max(45, int(minutes or 0))  # enforce a sensible lower bound
-    target = _pick_city(city)
-    if not target:
+def _solve_optimal(stops, minutes: int) -> Optional[Tuple[List[dict], int]]:
+    """0/1 knapsack over minute buckets: the subset of stops with the highest
+    total priority x minutes that fits the budget (ties keep earlier stops).
+    Chosen stops stay in dataset order. Returns None when the DP would exceed
+    PLAN_MAX_CELLS, so the caller can fall back to greedy.
+
+    `stops` yields (name, minutes, priority) triples."""
+    items = [(name, dur, pri) for name, dur, pri in stops if 0 < dur <= minutes]
+    if not items:
+        return [], 0
+    step = 0
+    for _, dur, _ in items:
+        step = gcd(step, dur)
+    cap = minutes // step
+    if len(items) * (cap + 1) > PLAN_MAX_CELLS:
         return None
-    stops = PLACES[target].get("stops", [])
-    chosen, used = _pack_stops(stops, minutes)
-    if not chosen:
-        # fallback: at least the first stop if exists
-        if stops:
-            first = stops[0]
-            used = min(minutes, int(first.get("minutes", 30)))
-            chosen = [{"name": first.get("name", "Stop 1"), "minutes": used}]
-        else:
-            return None
-    return {
-        "city": target,
+    ws = [dur // step for _, dur, _ in items]
+    take: List[int] = []
+    if all(pri == items[0][2] for _, _, pri in items):
+        # every stop weighs the same: maximize minutes via subset-sum on int bitsets
+        mask = (1 << (cap + 1)) - 1
+        reach = [1]
+        for w in ws:
+            reach.append((reach[-1] | (reach[-1] << w)) & mask)
+        c = reach[-1].bit_length() - 1
+        for i in range(len(ws) - 1, -1, -1):
+            if not (reach[i] >> c) & 1:
+                take.append(i)
+                c -= ws[i]
+    else:
+        best = [0.0] * (cap + 1)
+        keep: List[bytearray] = []
+        for w, (_, dur, pri) in zip(ws, items):
+            v = pri * dur
+            k = bytearray(cap + 1)
+            for c in range(cap, w - 1, -1):
+                cand = best[c - w] + v
+                if cand > best[c]:
+                    best[c] = cand
+                    k[c] = 1
+            keep.append(k)
+        c = max(range(cap + 1), key=best.__getitem__)
+        for i in range(len(ws) - 1, -1, -1):
+            if keep[i][c]:
+                take.append(i)
+                c -= ws[i]
+    chosen = [{"name": items[i][0] or "Stop", "minutes": items[i][1]} for i in reversed(take)]
+    return chosen, sum(s["minutes"] for s in chosen)
+
+class TravelIndex:
+    """Per-city stop-to-stop travel times (see `utils.geo.travel_matrix`), built
+    once per catalogue; cities whose stops lack coordinates are left out."""
+
+    def __init__(self, places: Catalogue):
+        self.matrices: Dict[str, array] = {}
+        for name, place in places.items():
+            if len(place.stop_names) > 1:
+                m = travel_matrix(place.stop_lat, place.stop_lon)
+                if m is not None:
+                    self.matrices[name] = m
+
+    def get(self, name: str) -> Optional[array]:
+        return self.matrices.get(name)
+
+catalogue.register_index("itinerary.travel", TravelIndex, config=(TRAVEL_SPEED_KMH, TRAVEL_DETOUR))
+
+def _route_order(mins, pris, travel, minutes: int) -> Tuple[List[int], int, int]:
+    """Orienteering over an open walk: choose and order stops so visits plus
+    travel fit `minutes`, maximizing priority x minutes. Best value-per-minute
+    insertion, then up to ROUTE_ROUNDS of local search (2-opt to cut travel,
+    re-insertion, and swapping a stop for a more valuable one), from an empty
+    route and from ROUTE_SEEDS single-stop seeds; the best result wins.
+
+    Returns (stop indices in visiting order, minutes used incl. travel, travel minutes)."""
+    n = len(mins)
+    d = travel.tolist()
+    val = [p * m for p, m in zip(pris, mins)]
+    cand = [i for i in range(n) if 0 < mins[i] <= minutes]
+
+    def path(route):
+        return sum(d[a * n + b] for a, b in zip(route, route[1:]))
+
+    def cost(route):
+        return sum(mins[i] for i in route) + path(route)
+
+    def insertion(route, c):
+        # cheapest (added minutes, position) for stop c
+        k, m = len(route), mins[c]
+        if not k:
+            return m, 0
+        best, pos = m + d[c * n + route[0]], 0
+        end = m + d[route[-1] * n + c]
+        if end < best:
+            best, pos = end, k
+        row = c * n
+        for p in range(1, k):
+            a, b = route[p - 1], route[p]
+            added = m + d[a * n + c] + d[row + b] - d[a * n + b]
+            if added < best:
+                best, pos = added, p
+        return best, pos
+
+    def fill(route, out, used):
+        while True:
+            pick = None
+            for c in out:
+                added, pos = insertion(route, c)
+                if used + added <= minutes:
+                    ratio = val[c] / added if added else float("inf")
+                    if pick is None or ratio > pick[0]:
+                        pick = (ratio, c, pos, added)
+            if pick is None:
+                return used
+            _, c, pos, added = pick
+            route.insert(pos, c)
+            out.remove(c)
+            used += added
+
+    def two_opt(route) -> bool:
+        improved = False
+        k = len(route)
+        for i in range(k - 1):
+            for j in range(i + 1, k):
+                a, b = route[i], route[j]
+                before = (d[route[i - 1] * n + a] if i else 0) + (d[b * n + route[j + 1]] if j + 1 < k else 0)
+                after = (d[route[i - 1] * n + b] if i else 0) + (d[a * n + route[j + 1]] if j + 1 < k else 0)
+                if after < before:
+                    route[i:j + 1] = route[i:j + 1][::-1]
+                    improved = True
+        return improved
+
+    def search(route):
+        out = [i for i in cand if i not in route]
+        used = fill(route, out, cost(route))
+        for _ in range(ROUTE_ROUNDS):
+            improved = False
+            if two_opt(route):
+                used = fill(route, out, cost(route))
+                improved = True
+            for p, r in enumerate(route):
+                rest = route[:p] + route[p + 1:]
+                base = cost(rest)
+                for c in out:
+                    if val[c] <= val[r]:
+                        continue
+                    added, pos = insertion(rest, c)
+                    if base + added <= minutes:
+                        rest.insert(pos, c)
+                        route[:] = rest
+                        out.remove(c)
+                        out.append(r)
+                        used = fill(route, out, base + added)
+                        improved = True
+                        break
+                if improved:
+                    break
+            if not improved:
+                break
+        return sum(val[i] for i in route), -used, route
+
+    # value-per-minute insertion can starve a long, valuable stop; also try
+    # seeding the route with each of the few most valuable ones
+    seeds = sorted(cand, key=lambda i: -val[i])[:ROUTE_SEEDS]
+    _, neg_used, route = max((search([]),) + tuple(search([i]) for i in seeds), key=lambda r: r[:2])
+    return route, -neg_used, path(route)
+
+def _route_stops(names, mins, travel, route) -> List[dict]:
+    n = len(mins)
+    chosen, prev = [], None
+    for i in route:
+        chosen.append({"name": names[i] or "Stop", "minutes": mins[i],
+                       "travel_minutes": travel[prev * n + i] if prev is not None else 0})
+        prev = i
+    return chosen
+
+def _solve_route(names, mins, pris, travel, minutes: int) -> Tuple[List[dict], int, int]:
+    """`_route_order` with the stops spelled out: (stops in visiting order,
+    minutes used incl. travel, travel minutes)."""
+    route, used, moving = _route_order(mins, pris, travel, minutes)
+    return _route_stops(names, mins, travel, route), used, moving
+
+def _resolve(strategy: str, travel) -> str:
+    if strategy == "auto" or (strategy == "route" and travel is None):
+        return "route" if travel is not None else "optimal"
+    return strategy
+
+def _stop_indices(place, chosen: List[dict]) -> Tuple[int, ...]:
+    # greedy/optimal keep dataset order, so the chosen stops are a subsequence
+    out, j = [], 0
+    for stop in chosen:
+        while (place.stop_names[j] or "Stop", place.stop_minutes[j]) != (stop["name"], stop["minutes"]):
+            j += 1
+        out.append(j)
+        j += 1
+    return tuple(out)
+
+# A solved plan, kept compact: (strategy that ran, minutes used, travel minutes,
+# stop indices, minutes of the clipped first stop when nothing fits else None)
+Entry = Tuple[str, int, int, Tuple[int, ...], Optional[int]]
+
+def _solve_place(cat: Catalogue, name: str, minutes: int, strategy: str) -> Optional[Entry]:
+    place = cat[name]
+    travel = cat.derived("itinerary.travel", TravelIndex).get(name)
+    strategy = _resolve(strategy, travel)
+    if strategy == "route":
+        route, used, moving = _route_order(place.stop_minutes, place.stop_priority, travel, minutes)
+        if route:
+            return strategy, used, moving, tuple(route), None
+    else:
+        solved = None
+        if strategy == "optimal":
+            solved = _solve_optimal(zip(place.stop_names, place.stop_minutes, place.stop_priority), minutes)
+            if solved is None:
+                strategy = "greedy"
+        chosen, used = solved or _pack_stops(place.stops(), minutes)
+        if chosen:
+            return strategy, used, 0, _stop_indices(place, chosen), None
+    # fallback: at least the first stop if exists
+    if not place.stop_names:
+        return None
+    first = min(minutes, place.stop_minutes[0])
+    return strategy, first, 0, (0,), first
+
+def _expand(cat: Catalogue, name: str, minutes: int, entry: Entry) -> dict:
+    strategy, used, moving, idx, first = entry
+    place = cat[name]
+    if first is not None:
+        stops = [{"name": place.stop_names[0] or "Stop 1", "minutes": first}]
+    elif strategy == "route":
+        travel = cat.derived("itinerary.travel", TravelIndex).get(name)
+        stops = _route_stops(place.stop_names, place.stop_minutes, travel, idx)
+    else:
+        stops = [{"name": place.stop_names[i] or "Stop", "minutes": place.stop_minutes[i]} for i in idx]
+    res = {
+        "city": name,
         "total_minutes": minutes,
         "planned_minutes": used,
-        "stops": chosen,
-        "note": "Greedy time packer (demo). Add maps/GPS/opening-hours for production."
+        "stops": stops,
+        "strategy": strategy,
+        "note": f"{strategy.capitalize()} time packer (demo). Add maps/GPS/opening-hours for production."
     }
+    if strategy == "route":
+        res["travel_minutes"] = moving   # included in planned_minutes
+        res["note"] = "Route planner (demo): travel times are straight-line estimates; add maps/opening-hours for production."
+    return res
+
+def _saturation(place, travel) -> int:
+    """A budget at which every stop fits whatever the order: any larger budget gives the same plan."""
+    total = sum(m for m in place.stop_minutes if m > 0)
+    if travel is not None:
+        total += (len(place.stop_minutes) - 1) * max(travel)
+    return max(MIN_MINUTES, total)
+
+_MISS = object()
+
+class PlanTable:
+    """Plans per (city, minutes, strategy), built once per catalogue.
+
+    Budgets at or above a city's saturation point share one entry. For the
+    strategy PLAN_STRATEGY resolves to, each city with stops is planned up
+    front at PLAN_GRID_STEP budgets up to PLAN_GRID_MAX (what the suggestion
+    chips ask for); other strategies and budgets are planned on first use and
+    kept in a bounded LRU. Entries are compact tuples of stop indices; `get`
+    builds a fresh result dict from one.
+    """
+
+    def __init__(self, places: Catalogue):
+        self.grid: Dict[tuple, Optional[Entry]] = {}
+        self.caps: Dict[str, Tuple[int, int]] = {}   # name -> saturation without / with travel
+        budgets = sorted({max(MIN_MINUTES, m) for m in range(PLAN_GRID_STEP, PLAN_GRID_MAX + 1, PLAN_GRID_STEP)}) \
+            if PLAN_GRID_STEP > 0 else []
+        travel = places.derived("itinerary.travel", TravelIndex)
+        for name, place in places.items():
+            if not place.stop_names:
+                continue   # always None
+            matrix = travel.get(name)
+            self.caps[name] = (_saturation(place, None), _saturation(place, matrix))
+            strategy = _resolve(PLAN_STRATEGY, matrix)
+            for m in budgets:
+                key = self._key(name, m, strategy)
+                if key not in self.grid:
+                    self.grid[key] = _solve_place(places, name, m, strategy)
+        self.extra = TTLCache(PLAN_CACHE_SIZE)
+
+    def _key(self, name: str, minutes: int, strategy: str) -> tuple:
+        plain, route = self.caps[name]
+        return name, min(minutes, route if strategy == "route" else plain), strategy
+
+    def __getstate__(self):
+        return {"grid": self.grid, "caps": self.caps}   # the lazy part is per process
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.extra = TTLCache(PLAN_CACHE_SIZE)
+
+    def get(self, cat: Catalogue, name: str, minutes: int, strategy: str) -> Optional[dict]:
+        if name not in self.caps:
+            return None   # no stops
+        strategy = _resolve(strategy, cat.derived("itinerary.travel", TravelIndex).get(name))
+        key = self._key(name, minutes, strategy)
+        entry = self.grid.get(key, _MISS)
+        if entry is _MISS:
+            entry = self.extra.get(key, _MISS)
+            if entry is _MISS:
+                entry = _solve_place(cat, name, key[1], strategy)
+                self.extra.set(key, entry)
+        return None if entry is None else _expand(cat, name, minutes, entry)
+
+    def stats(self) -> dict:
+        return {"grid": len(self.grid), **self.extra.stats()}
+
+catalogue.register_index("itinerary.plans", PlanTable, config=(
+    PLAN_STRATEGY, ROUTE_ROUNDS, ROUTE_SEEDS, PLAN_MAX_CELLS, PLAN_GRID_STEP, PLAN_GRID_MAX, TRAVEL_SPEED_KMH, TRAVEL_DETOUR))
+
+def plan(city: str, minutes: int = 180, strategy: Optional[str] = None) -> Optional[dict]:
+    """Plan stops for `city` within `minutes`.
+
+    strategy: "route" (orders stops and counts travel between them; needs stop
+    coordinates), "optimal" (knapsack, best use of the budget), "greedy"
+    (dataset order) or "auto" (route when the city has coordinates, else
+    optimal); defaults to PLAN_STRATEGY. Optimal falls back to greedy for stop
+    sets too large to solve within PLAN_MAX_CELLS; the returned "strategy" says
+    which ran, and route plans count travel in planned_minutes. Until the
+    precomputed PlanTable exists, each call solves its own (city, budget)."""
+    strategy = strategy or PLAN_STRATEGY
+    if strategy not in STRATEGIES:
+        raise ValueError(f"unknown strategy {strategy!r}; expected one of {STRATEGIES}")
+    minutes = max(MIN_MINUTES, int(minutes or 0))  # enforce a sensible lower bound
+    cat = catalogue.get()
+    target = _pick_city(city, cat)
+    if not target:
+        return None
+    table = cat.peek("itinerary.plans", PlanTable)
+    if table is not None:
+        return table.get(cat, target, minutes, strategy)
+    # the table is still being built (warm-up, reload or in the background): solve just this one
+    place = cat[target]
+    if not place.stop_names:
+        return None
+    travel = cat.derived("itinerary.travel", TravelIndex).get(target)
+    strategy = _resolve(strategy, travel)
+    capped = min(minutes, _saturation(place, travel if strategy == "route" else None))
+    entry = _solve_place(cat, target, capped, strategy)
+    return None if entry is None else _expand(cat, target, minutes, entry)
+
+def plan_cache_stats() -> Optional[dict]:
+    """Stats of the live plan table; None if the catalogue or the table is not built yet (never builds them)."""
+    cat = catalogue.loaded()
+    table = cat.peek("itinerary.plans") if cat is not None else None
+    return table.stats() if table is not None else None
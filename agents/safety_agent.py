@@ -1,9 +1,8 @@
 ﻿from typing import Tuple
 from better_profanity import profanity
 import re
-
-# Load profanity dictionary (already includes strong words)
-profanity.load_censor_words()
+from utils.matcher import AhoCorasick, SubstitutionTrie
+from utils.startup import Lazy
 
 BANNED_SUBSTRINGS = {
     "kill", "harm", "bomb", "terror", "suicide",
@@ -16,17 +15,75 @@ BANNED_SUBSTRINGS = {
 
 URL_PAT = re.compile(r"https?://[^\s]+", re.I)
 EMAIL_PAT = re.compile(r"[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}", re.I)
+HTML_TAG_PAT = re.compile(r"<\s*\/?\s*[a-z][a-z0-9\-]*\s*[^>]*>", re.I)
+
+class SafetyMatcher:
+    """All input checks compiled once: banned substrings (Aho-Corasick) and the
+    profanity wordlist (a trie that accepts the library's leetspeak spellings).
+
+    `profane` applies the same word/multi-word rules as
+    `profanity.contains_profanity`, without its linear scan of the wordlist.
+    """
+
+    def __init__(self, banned, prof):
+        self.banned = tuple(banned)  # keeps the set's iteration order for reason codes
+        self._banned = AhoCorasick((b, b) for b in self.banned)
+        self._words = SubstitutionTrie((str(w) for w in prof.CENSOR_WORDSET), prof.CHARS_MAPPING)
+        self._combos = prof.MAX_NUMBER_COMBINATIONS
+        allowed = "".join(sorted(prof.ALLOWED_CHARACTERS))
+        self._word_re = re.compile("[" + re.escape(allowed) + "]+")
+
+    def profane(self, text: str) -> bool:
+        n = len(text)
+        spans = [m.span() for m in self._word_re.finditer(text)]
+        if not spans or spans[0][0] >= n - 1:
+            return False
+        words = self._words
+        for k, (s, e) in enumerate(spans):
+            word = text[s:e].lower()
+            if e == n:  # last word runs to the end: checked on its own
+                return word in words
+            # the word joined with up to N following words, with and without separators
+            joined = joined_sep = word
+            prev = e
+            for s2, e2 in spans[k + 1:k + 1 + self._combos]:
+                if s2 >= n - 1:
+                    break
+                nxt = text[s2:e2].lower()
+                joined += nxt
+                joined_sep += text[prev:s2].lower() + nxt
+                if joined in words or joined_sep in words:
+                    return True
+                prev = e2
+            if word in words:
+                return True
+        return False
+
+    def banned_hit(self, text: str) -> str:
+        hits = self._banned.values((text or "").lower())
+        for bad in self.banned:
+            if bad in hits:
+                return bad
+        return ""
+
+def _build_matcher() -> SafetyMatcher:
+    # Load profanity dictionary (already includes strong words)
+    profanity.load_censor_words()
+    return SafetyMatcher(BANNED_SUBSTRINGS, profanity)
+
+_matcher = Lazy("safety.matcher", _build_matcher)
+
+def __getattr__(name):
+    if name == "MATCHER":
+        return _matcher.get()
+    raise AttributeError(name)
 
 def _contains_banned(text: str) -> str:
-    t = (text or "").lower()
-    for bad in BANNED_SUBSTRINGS:
-        if bad in t:
-            return bad
-    return ""
+    return _matcher.get().banned_hit(text)
 
 def check_input(text: str) -> Tuple[bool, str]:
     t = (text or "")
-    if profanity.contains_profanity(t):
+    if _matcher.get().profane(t):
         return False, "profanity"
     bad = _contains_banned(t)
     if bad:
@@ -34,7 +91,7 @@ def check_input(text: str) -> Tuple[bool, str]:
     # crude HTML/script detection
     if "<" in t or ">" in t:
         # allow markdown-like "<3" or escaped html, but block raw tags
-        if re.search(r"<\s*\/?\s*[a-z][a-z0-9\-]*\s*[^>]*>", t, re.I):
+        if HTML_TAG_PAT.search(t):
             return False, "raw_html_tag"
     return True, ""
 
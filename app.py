@@ -1,33 +1,159 @@
-﻿import os
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+﻿import os, json, time
+from utils import startup  # first, so STARTUP_REPORT=1 can time the imports below
+from typing import Tuple
+from flask import Flask, Response, g, render_template, request, jsonify, redirect, url_for, session, stream_with_context
 from dotenv import load_dotenv
 from utils.auth import login as do_login, logout as do_logout, require_auth
-from utils.crypto_log import write_event
-from utils.llm import polish_text
+from utils.crypto_log import write_event, stats as audit_stats
+from utils import auth, catalogue, metrics, sessions
+from utils.llm import polish_text, polish_stream, STATS as LLM_STATS, cache_stats as llm_cache_stats
+from agents import safety_agent
 from agents.safety_agent import check_input, sanitize, check_output
-from agents.dialogue_agent import route_intent, parse_minutes
-from agents.ir_agent import lookup_place, list_places
-from agents.itinerary_agent import plan
+from agents.dialogue_agent import (route_intent, route_cache_info, parse_minutes, facts_reply, itinerary_reply,
+                                  Rendered, renders, render_facts, render_itinerary)
+from agents.ir_agent import lookup_place, similar_places
+from agents.itinerary_agent import plan, plan_cache_stats
+from batch import read_items, run_batch
 
 load_dotenv()
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-key")
+sessions.init_app(app)  # dialogue state lives server-side; the cookie only holds an ID
 
-WELCOME = (
-    "Hi! I am your Virtual Tour Guide.\n"
-    "Try: **Tell me about Sigiriya** or **Plan a 3-hour tour in Kandy**.\n"
-    "Places in my dataset: " + ", ".join(list_places()[:12]) + " …"
+def _welcome(cat) -> str:
+    return (
+        "Hi! I am your Virtual Tour Guide.\n"
+        "Try: **Tell me about Sigiriya** or **Plan a 3-hour tour in Kandy**.\n"
+        "Places in my dataset: " + ", ".join(catalogue.list_names(cat)[:12]) + " …"
+    )
+
+def welcome() -> str:
+    """Greeting for the current catalogue; rebuilt when the catalogue reloads."""
+    return catalogue.get().derived("app.welcome", _welcome)
+
+catalogue.start_watcher()  # pick up edits to data/places.json without a restart
+
+# ---------- deferred startup: heavy state is built off the import path (see utils.startup) ----------
+# the neighbour and plan tables take seconds at large catalogues: requests read
+# them with Catalogue.peek and answer without them (no related-place chips,
+# plans solved per call) until they exist, so they are built last
+OPTIONAL_INDEXES = ("ir.similar", "itinerary.plans")
+
+def _warm_indexes(optional: bool):
+    cat = catalogue.get()
+    for key, build in list(catalogue.INDEX_BUILDERS.items()):
+        if (key in OPTIONAL_INDEXES) == optional:
+            cat.derived(key, build)
+
+WARM_UP = (
+    ("auth.admin_hash", lambda: auth.ADMIN_HASH),
+    ("safety.matcher", lambda: safety_agent.MATCHER),
+    ("catalogue.load", catalogue.get),
+    ("catalogue.indexes", lambda: _warm_indexes(False)),
+    ("app.welcome", welcome),
+    ("catalogue.indexes.optional", lambda: _warm_indexes(True)),
 )
+startup.mark("app_imported")
+startup.start(WARM_UP)
+if startup.STARTUP_REPORT:
+    if startup.STARTUP_MODE == "background":
+        startup.wait_ready(30)   # the report is about the complete warm-up
+    startup.print_report()
+
+# ---------- instrumentation: per-stage timings, counters, /metrics, opt-in profiling ----------
+STAGE = "vtg_stage_seconds"
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") in ("1", "true", "yes")  # honour the header at all?
+PROFILE_HEADER = "X-Profile"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "logs/profiles")
+
+metrics.describe(STAGE, "histogram", "Seconds spent in each stage of a chat turn.")
+metrics.describe("vtg_request_seconds", "histogram", "Request latency by endpoint.")
+metrics.describe("vtg_safety_blocks_total", "counter", "Messages blocked by the Safety Agent.")
+metrics.describe("vtg_replies_total", "counter", "Chat replies by path: template (no LLM) or polish.")
+
+check_input = metrics.timed(STAGE, stage="check_input")(check_input)
+sanitize = metrics.timed(STAGE, stage="sanitize")(sanitize)
+route_intent = metrics.timed(STAGE, stage="route_intent")(route_intent)
+lookup_place = metrics.timed(STAGE, stage="lookup_place")(lookup_place)
+plan = metrics.timed(STAGE, stage="plan")(plan)
+polish_text = metrics.timed(STAGE, stage="polish_text")(polish_text)
+check_output = metrics.timed(STAGE, stage="check_output")(check_output)
+write_event = metrics.timed(STAGE, stage="write_event")(write_event)
+
+def _collect():
+    for event, n in LLM_STATS.items():
+        yield "vtg_llm_events_total", "counter", "LLM calls and local-formatter fallbacks.", {"event": event}, n
+    # only state that already exists: a scrape must never load the catalogue or build an index
+    caches = {"route": route_cache_info(), "plan": plan_cache_stats(), **{
+        f"llm_{tier}": st for tier, st in llm_cache_stats().items()}}
+    for name, st in caches.items():
+        if not st:
+            continue
+        yield "vtg_cache_hits_total", "counter", "Cache hits.", {"cache": name}, st["hits"]
+        yield "vtg_cache_misses_total", "counter", "Cache misses.", {"cache": name}, st["misses"]
+    reloads = catalogue.reload_stats()
+    for result, key in (("ok", "reloads"), ("failed", "reload_failures")):
+        yield "vtg_catalogue_reloads_total", "counter", "Catalogue reloads.", {"result": result}, reloads.get(key, 0)
+    if reloads["last"]:
+        yield ("vtg_catalogue_reload_seconds", "gauge", "Duration of the last reload attempt.", {},
+               reloads["last"]["seconds"])
+    audit = audit_stats()
+    for result, key in (("written", "written"), ("dropped", "dropped")):
+        yield "vtg_audit_events_total", "counter", "Audit events written or dropped.", {"result": result}, audit.get(key, 0)
+    yield "vtg_audit_write_errors_total", "counter", "Failed audit log writes (retried).", {}, audit.get("write_errors", 0)
+    yield "vtg_audit_queued", "gauge", "Audit events waiting for the writer.", {}, audit["queued"]
+    cat = catalogue.loaded()
+    if cat is not None:
+        yield "vtg_catalogue_places", "gauge", "Places in the live catalogue.", {}, len(cat)
+    for phase, ms in startup.report()["phases_ms"].items():
+        yield "vtg_startup_seconds", "gauge", "Startup phase durations.", {"phase": phase}, ms / 1000
+
+metrics.register_collector(_collect)
+
+@app.before_request
+def _begin_request():
+    g.started = time.perf_counter()
+    if PROFILE_REQUESTS and request.headers.get(PROFILE_HEADER):
+        g.profiler = metrics.SamplingProfiler().start()
+
+@app.after_request
+def _end_request(response):
+    metrics.observe("vtg_request_seconds", time.perf_counter() - g.started, endpoint=request.endpoint or "unknown")
+    prof = g.pop("profiler", None)
+    if prof is not None:
+        prof.stop()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{os.getpid()}-{id(prof):x}.folded"
+        with open(os.path.join(PROFILE_DIR, name), "w", encoding="utf-8") as f:
+            f.write(prof.collapsed())
+        response.headers["X-Profile-File"] = name
+        response.headers["X-Profile-Samples"] = str(prof.samples)
+    return response
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text format."""
+    if not metrics.ENABLED:
+        return Response("metrics disabled\n", status=404, mimetype="text/plain")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 # ---------- helpers: safe, markdown-friendly responses + smart suggestions ----------
+def blocked_output(reason: str) -> dict:
+    metrics.inc("vtg_safety_blocks_total", kind="output")
+    write_event({"agent": "safety", "blocked_output": reason})
+    return {"reply": "⚠️ Output blocked by Safety Agent.",
+            "suggestions": ["Help", "Tell me about Sigiriya", "Plan a 3-hour tour in Kandy"]}
+
 def respond(text: str, suggestions=None, status: int = 200):
-    """Polish + safety check + JSON envelope with optional suggestions."""
-    text = polish_text(text)
+    """Polish (unless already rendered) + safety check + JSON envelope with optional suggestions."""
+    if isinstance(text, Rendered):
+        metrics.inc("vtg_replies_total", path="template")
+    else:
+        text = polish_text(text)
+        metrics.inc("vtg_replies_total", path="polish")
     ok_out, reason_out = check_output(text)
     if not ok_out:
-        write_event({"agent": "safety", "blocked_output": reason_out})
-        text = "⚠️ Output blocked by Safety Agent."
-        suggestions = ["Help", "Tell me about Sigiriya", "Plan a 3-hour tour in Kandy"]
+        return jsonify(blocked_output(reason_out)), status
     return jsonify({"reply": text, "suggestions": suggestions or []}), status
 
 def clear_slots():
@@ -41,9 +167,11 @@ def suggest_for(intent: str, payload: dict | None = None, extra_city: str | None
     if intent in ("help", "unknown"):
         return ["Tell me about Sigiriya", "Plan a 3-hour tour in Kandy"]
     if intent == "facts" and city:
-        return [f"Plan a 2-hour tour in {city}", f"Ticket price in {city}", "Another city"]
+        related = [f"Tell me about {p}" for p in similar_places(city, 2)] or ["Another city"]
+        return [f"Plan a 2-hour tour in {city}", f"Ticket price in {city}", *related]
     if intent == "itinerary" and city:
-        return [f"Facts about {city}", "Plan another city", "Help"]
+        related = [f"Plan a 2-hour tour in {p}" for p in similar_places(city, 1)] or ["Plan another city"]
+        return [f"Facts about {city}", *related, "Help"]
     if intent == "chitchat":
         return ["Tell me about Sigiriya", "Plan a 2-hour tour", "Help"]
     if intent == "await_city":
@@ -90,18 +218,13 @@ def state():
     return jsonify({"city": s.get("city"), "minutes": s.get("minutes")})
 
 # ---------- Chat ----------
-@app.post("/chat")
-def chat():
-    if not require_auth():
-        return jsonify({"reply": "Please login first.", "suggestions": []}), 401
-
-    data = request.get_json(silent=True) or {}
-    raw = data.get("message", "")
-
+def handle_message(raw: str) -> Tuple[str, list]:
+    """Run one dialogue turn; returns the unpolished reply and its suggestion chips."""
     ok, reason = check_input(raw)
     if not ok:
+        metrics.inc("vtg_safety_blocks_total", kind="input")
         write_event({"agent": "safety", "blocked_input": reason, "text": raw})
-        return respond("❌ Safety Agent blocked your input.", ["Help"])
+        return "❌ Safety Agent blocked your input.", ["Help"]
 
     user_msg = sanitize(raw)
 
@@ -114,7 +237,7 @@ def chat():
         slots["city"] = user_msg
         session["pending"] = "minutes"
         session["slots"] = slots
-        return respond(
+        return (
             f"Great. How much time do you have for **{slots['city']}**? (e.g., *2 hours* or *120 min*)",
             suggest_for("await_minutes", extra_city=slots["city"])
         )
@@ -122,7 +245,7 @@ def chat():
     if pending == "minutes":
         mins = parse_minutes(user_msg)
         if not mins:
-            return respond(
+            return (
                 "Please tell me the time like **2 hours** or **150 min**.",
                 ["1 hour", "2 hours", "3 hours"]
             )
@@ -132,47 +255,37 @@ def chat():
         clear_slots()
         if not res or not res.get("stops"):
             reply = "I couldn't plan that. Try **Plan a 3-hour tour in Kandy**."
-            return respond(reply, ["Plan a 3-hour tour in Kandy", "Help"])
+            return reply, ["Plan a 3-hour tour in Kandy", "Help"]
         else:
-            lines = [f"{i+1}. {s['name']} — ~{s['minutes']} min" for i, s in enumerate(res["stops"])]
-            reply = (
-                f"**{res['city']} — {res['planned_minutes']}/{res['total_minutes']} min**\n"
-                + "\n".join(lines)
-                + "\n\nWant **ticket info** or some **quick facts** for this city?"
-            )
+            reply = (render_itinerary if renders("itinerary") else itinerary_reply)(
+                res, "Want **ticket info** or some **quick facts** for this city?")
         write_event({"agent": "dialogue", "intent": "itinerary",
                      "payload": {"city": res.get("city"), "minutes": res.get("total_minutes")}})
-        return respond(reply, suggest_for("itinerary", extra_city=res.get("city")))
+        return reply, suggest_for("itinerary", extra_city=res.get("city"))
 
     # No pending slot → normal intent routing
     intent, payload = route_intent(user_msg)
 
     if intent in ("help", "unknown"):
-        return respond(WELCOME, suggest_for(intent))
+        return welcome(), suggest_for(intent)
 
     if intent == "chitchat":
         reply = (
             "Hello! I'm glad you're here. I can share quick facts about places or plan a mini tour.\n\n"
             "Try: **Tell me about Sigiriya** or **Plan a 2-hour tour in Kandy**."
         )
-        return respond(reply, suggest_for("chitchat"))
+        return reply, suggest_for("chitchat")
 
     if intent == "facts":
         res = lookup_place(payload.get("place", ""))
         if not res:
-            return respond(
-                "I couldn't find that place. Try one of these: " + ", ".join(list_places()[:12]) + " …",
+            return (
+                "I couldn't find that place. Try one of these: " + ", ".join(catalogue.list_names()[:12]) + " …",
                 ["Tell me about Sigiriya", "Tell me about Kandy", "Plan a 3-hour tour in Kandy"]
             )
-        facts = "\n- " + "\n- ".join(res["facts"]) if res["facts"] else "No facts."
-        reply = (
-            f"**{res['place']}**{facts}\n\n"
-            f"**Ticket:** {res['ticket']}\n\n"
-            f"Would you like a 2–3 stop **mini tour** in **{res['place']}**? "
-            f"Tell me your time (e.g., *2 hours*)."
-        )
+        reply = (render_facts if renders("facts") else facts_reply)(res)
         write_event({"agent": "dialogue", "intent": "facts", "payload": {"place": res["place"]}})
-        return respond(reply, suggest_for("facts", {"place": res["place"]}))
+        return reply, suggest_for("facts", {"place": res["place"]})
 
     if intent == "itinerary":
         city = payload.get("city")
@@ -180,14 +293,14 @@ def chat():
         if not city:
             session["pending"] = "city"
             session["slots"] = {}
-            return respond(
+            return (
                 "Which **city** would you like a tour for?",
                 suggest_for("await_city")
             )
         if not minutes:
             session["pending"] = "minutes"
             session["slots"] = {"city": city}
-            return respond(
+            return (
                 f"How much **time** do you have for **{city}**? (e.g., *2 hours* or *120 min*)",
                 suggest_for("await_minutes", extra_city=city)
             )
@@ -195,19 +308,67 @@ def chat():
         res = plan(city, int(minutes))
         if not res or not res.get("stops"):
             reply = "I couldn't plan that. Try **Plan a 3-hour tour in Kandy**."
-            return respond(reply, ["Plan a 3-hour tour in Kandy", "Help"])
+            return reply, ["Plan a 3-hour tour in Kandy", "Help"]
         else:
-            lines = [f"{i+1}. {s['name']} — ~{s['minutes']} min" for i, s in enumerate(res["stops"])]
-            reply = (
-                f"**{res['city']} — {res['planned_minutes']}/{res['total_minutes']} min**\n"
-                + "\n".join(lines)
-                + "\n\nWant **ticket info** or **quick facts** as well?"
-            )
+            reply = (render_itinerary if renders("itinerary") else itinerary_reply)(
+                res, "Want **ticket info** or **quick facts** as well?")
         write_event({"agent": "dialogue", "intent": "itinerary", "payload": {"city": city, "minutes": minutes}})
-        return respond(reply, suggest_for("itinerary", {"city": city}))
+        return reply, suggest_for("itinerary", {"city": city})
 
     # Fallback
-    return respond(WELCOME, suggest_for("help"))
+    return welcome(), suggest_for("help")
+
+@app.post("/chat")
+def chat():
+    if not require_auth():
+        return jsonify({"reply": "Please login first.", "suggestions": []}), 401
+
+    data = request.get_json(silent=True) or {}
+    return respond(*handle_message(data.get("message", "")))
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+def chat_stream():
+    """Server-sent events: `draft` (unpolished reply) right away, `polish` as the
+    rewrite grows, then `final`. Every message passes check_output first."""
+    if not require_auth():
+        return jsonify({"reply": "Please login first.", "suggestions": []}), 401
+
+    data = request.get_json(silent=True) or {}
+    # run the turn now so slot changes make it into the session cookie
+    text, suggestions = handle_message(data.get("message", ""))
+
+    def events():
+        ok_out, reason_out = check_output(text)
+        if not ok_out:
+            yield _sse("final", blocked_output(reason_out))
+            return
+        yield _sse("draft", {"reply": text, "suggestions": suggestions})
+        final = text
+        for partial in (() if isinstance(text, Rendered) else polish_stream(text)):
+            ok_out, reason_out = check_output(partial)
+            if not ok_out:
+                yield _sse("final", blocked_output(reason_out))
+                return
+            final = partial
+            yield _sse("polish", {"reply": partial})
+        yield _sse("final", {"reply": final, "suggestions": suggestions})
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/chat/batch")
+def chat_batch():
+    """JSONL in (one message per line), JSONL out with per-stage timings; see batch.py."""
+    if not require_auth():
+        return jsonify({"reply": "Please login first.", "suggestions": []}), 401
+
+    items = list(read_items(request.get_data(as_text=True).splitlines()))
+    polish = request.args.get("polish") in ("1", "true", "yes")
+    lines = (json.dumps(r, ensure_ascii=False) + "\n" for r in run_batch(items, polish=polish))
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson")
 
 if __name__ == "__main__":
     app.run(debug=True, threaded=True)
@@ -0,0 +1,159 @@
+﻿"""Offline batch runner: push JSONL messages through the agents without the web layer.
+
+    python batch.py messages.jsonl [-o results.jsonl] [--workers 4] [--polish]
+
+Each input line is a JSON object with a "message" (or --field) and an optional
+"id"/"request_id", or a bare JSON string. Each output line carries the routed
+intent, the agent result and per-stage timings in milliseconds; a line that is
+not valid input gets an output line with an "error" instead. Turns are
+stateless: itinerary requests missing a city or time are reported, not asked for.
+"""
+import argparse, json, sys, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO
+from agents.safety_agent import check_input, sanitize
+from agents.dialogue_agent import route_intent, facts_reply, itinerary_reply, Rendered, renders, render_facts, render_itinerary
+from agents.ir_agent import lookup_place
+from agents.itinerary_agent import plan
+
+CHUNK = 256
+
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 3)
+
+
+def run_message(item: Dict[str, Any]) -> Dict[str, Any]:
+    """One stateless turn: check_input → sanitize → route_intent → lookup_place/plan."""
+    if "error" in item:
+        return dict(item)   # rejected by read_items
+    raw = item.get("message", "")
+    out: Dict[str, Any] = {"id": item.get("id"), "message": raw}
+    timings = out["timings"] = {}
+
+    t0 = time.perf_counter()
+    ok, reason = check_input(raw)
+    timings["check_input"] = _ms(t0)
+    if not ok:
+        out.update(intent="blocked", blocked=reason)
+        return out
+
+    t0 = time.perf_counter()
+    msg = sanitize(raw)
+    timings["sanitize"] = _ms(t0)
+
+    t0 = time.perf_counter()
+    intent, payload = route_intent(msg)
+    timings["route_intent"] = _ms(t0)
+    out.update(intent=intent, payload=dict(payload))
+
+    if intent == "facts":
+        t0 = time.perf_counter()
+        res = lookup_place(payload.get("place", ""))
+        timings["lookup_place"] = _ms(t0)
+        out["result"] = res
+        if res:
+            out["reply"] = (render_facts if renders("facts") else facts_reply)(res)
+    elif intent == "itinerary":
+        if not payload.get("city") or not payload.get("minutes"):
+            out["needs"] = "city" if not payload.get("city") else "minutes"
+        else:
+            t0 = time.perf_counter()
+            res = plan(payload["city"], int(payload["minutes"]))
+            timings["plan"] = _ms(t0)
+            out["result"] = res
+            if res and res.get("stops"):
+                out["reply"] = (render_itinerary if renders("itinerary") else itinerary_reply)(
+                    res, "Want **ticket info** or **quick facts** as well?")
+    return out
+
+
+def _polish(result: Dict[str, Any]) -> Dict[str, Any]:
+    from utils.llm import polish_text
+    if result.get("reply") and not isinstance(result["reply"], Rendered):
+        t0 = time.perf_counter()
+        result["polished"] = polish_text(result["reply"])
+        result["timings"]["polish_text"] = _ms(t0)
+    return result
+
+
+def read_items(lines: Iterable[str], field: str = "message") -> Iterator[Dict[str, Any]]:
+    """Parse JSONL input; a bad line becomes {"id": line number, "error": ...} rather than an exception."""
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            yield {"id": n, "error": f"line {n}: invalid JSON ({e})"}
+            continue
+        if isinstance(obj, str):
+            yield {"id": n, "message": obj}
+        elif not isinstance(obj, dict):
+            yield {"id": n, "error": f"line {n}: expected a JSON object or string, got {type(obj).__name__}"}
+        elif not isinstance(obj.get(field), str):
+            yield {"id": obj.get("id", obj.get("request_id", n)), "error": f'line {n}: "{field}" must be a string'}
+        else:
+            yield {"id": obj.get("id", obj.get("request_id", n)), "message": obj[field]}
+
+
+def run_batch(items: Iterable[Dict[str, Any]], workers: int = 0, polish: bool = False,
+              polish_workers: int = 8) -> Iterator[Dict[str, Any]]:
+    """Yield results in input order. `workers` > 0 runs the agents in a process
+    pool; polishing (network-bound) is done per chunk on a thread pool."""
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    polisher = ThreadPoolExecutor(max_workers=polish_workers) if polish else None
+    try:
+        it = iter(items)
+        while True:
+            chunk = list(islice(it, CHUNK))
+            if not chunk:
+                break
+            results = pool.map(run_message, chunk, chunksize=16) if pool else map(run_message, chunk)
+            if polisher:
+                results = polisher.map(_polish, list(results))
+            yield from results
+    finally:
+        if pool:
+            pool.shutdown()
+        if polisher:
+            polisher.shutdown()
+
+
+def write_jsonl(results: Iterable[Dict[str, Any]], out: TextIO) -> int:
+    count = 0
+    for r in results:
+        out.write(json.dumps(r, ensure_ascii=False) + "\n")
+        out.flush()
+        count += 1
+    return count
+
+
+def main(argv: Optional[list] = None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("input", help="JSONL file of messages ('-' for stdin)")
+    ap.add_argument("-o", "--output", help="write JSONL results here instead of stdout")
+    ap.add_argument("--field", default="message", help="message field in each input object")
+    ap.add_argument("--workers", type=int, default=0, help="agent processes (0 = run in-process)")
+    ap.add_argument("--polish", action="store_true",
+                    help="also run polish_text on facts/itinerary replies not rendered by template (RENDER_INTENTS)")
+    args = ap.parse_args(argv)
+
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8-sig")
+    dst = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    started = time.perf_counter()
+    try:
+        count = write_jsonl(run_batch(read_items(src, args.field), args.workers, args.polish), dst)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+    elapsed = time.perf_counter() - started
+    print(f"{count} messages in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f} msg/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
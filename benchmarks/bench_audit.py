@@ -0,0 +1,50 @@
+﻿"""Audit log: request-path latency and throughput, per-event append vs the background AuditWriter.
+
+The writer does not make the disk faster (with Fernet, encryption dominates and
+total events/s is about the same); what it buys is the request path: submit()
+only enqueues, so a request no longer waits on encrypt + open + append.
+
+Run from the repo root:  python -m benchmarks.bench_audit
+"""
+import os, tempfile, time
+from cryptography.fernet import Fernet
+from utils import crypto_log
+from benchmarks.common import summarize
+
+N = 5_000
+
+def per_event(path: str):
+    lat = []
+    for i in range(N):
+        t = time.perf_counter()
+        crypto_log._append(path, crypto_log._encode(crypto_log._stamp({"agent": "bench", "i": i})))
+        lat.append((time.perf_counter() - t) * 1000)
+    return lat
+
+def background(path: str, fsync: str):
+    w = crypto_log.AuditWriter(path, fsync=fsync)
+    lat = []
+    for i in range(N):
+        t = time.perf_counter()
+        w.submit(crypto_log._stamp({"agent": "bench", "i": i}))
+        lat.append((time.perf_counter() - t) * 1000)
+    w.close()
+    return lat
+
+def bench(label: str, fn, *args):
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "audit.log")
+        t0 = time.perf_counter()
+        lat = fn(path, *args)
+        elapsed = time.perf_counter() - t0
+    s = summarize(label, lat)
+    print(f"{label:<34} {N / elapsed:8.0f} events/s   request path p50 {s['p50_ms'] * 1000:7.1f} us"
+          f"  p99 {s['p99_ms'] * 1000:7.1f} us")
+
+if __name__ == "__main__":
+    for key in (None, Fernet.generate_key()):
+        crypto_log.fernet = Fernet(key) if key else None
+        tag = "fernet" if key else "plain"
+        bench(f"[{tag}] per-event open+append", per_event)
+        bench(f"[{tag}] background, fsync per batch", background, "batch")
+        bench(f"[{tag}] background, no fsync", background, "never")
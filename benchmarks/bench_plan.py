@@ -0,0 +1,54 @@
+﻿"""Budget use and solve time: greedy packer vs the knapsack solver, on synthetic stop sets,
+and the route planner (travel-aware) on synthetic stops with coordinates.
+
+Run from the repo root:  python -m benchmarks.bench_plan
+"""
+import random, time
+from statistics import mean, median
+from agents.itinerary_agent import _pack_stops, _solve_optimal, _solve_route
+from utils.geo import travel_matrix
+
+BUDGETS = [60, 90, 120, 180, 240, 360, 480]
+
+def stop_set(n: int, rnd: random.Random):
+    return [(f"Stop {i}", rnd.choice([15, 20, 30, 40, 45, 60, 75, 90, 120]), 1.0) for i in range(n)]
+
+def run(n: int, cities: int = 50, seed: int = 3):
+    rnd = random.Random(seed)
+    sets = [stop_set(n, rnd) for _ in range(cities)]
+    for label, solve in (("greedy", lambda s, b: _pack_stops(((x, d) for x, d, _ in s), b)),
+                         ("optimal", lambda s, b: _solve_optimal(s, b))):
+        fill, times = [], []
+        for stops in sets:
+            for budget in BUDGETS:
+                t0 = time.perf_counter()
+                res = solve(stops, budget)
+                times.append((time.perf_counter() - t0) * 1e6)
+                fill.append(res[1] / budget if res else 0.0)
+        print(f"{n:>4} stops  {label:<8} budget used {mean(fill):6.1%}  p50 {median(times):8.1f} us  max {max(times):8.1f} us")
+
+def run_route(n: int, cities: int = 50, seed: int = 3):
+    rnd = random.Random(seed)
+    fill, travel, times = [], [], []
+    for _ in range(cities):
+        mins = [rnd.choice([15, 20, 30, 40, 45, 60, 75, 90, 120]) for _ in range(n)]
+        pris = [rnd.choice([1.0, 1.0, 2.0, 3.0]) for _ in range(n)]
+        lats = [7.29 + rnd.random() * 0.05 for _ in range(n)]   # a ~5 km square
+        lons = [80.63 + rnd.random() * 0.05 for _ in range(n)]
+        names = [f"Stop {i}" for i in range(n)]
+        matrix = travel_matrix(lats, lons)
+        for budget in BUDGETS:
+            t0 = time.perf_counter()
+            _, used, moving = _solve_route(names, mins, pris, matrix, budget)
+            times.append((time.perf_counter() - t0) * 1e3)
+            fill.append(used / budget)
+            travel.append(moving / used if used else 0.0)
+    times.sort()
+    print(f"{n:>4} stops  route    budget used {mean(fill):6.1%}  travel share {mean(travel):5.1%}  "
+          f"p50 {median(times):6.2f} ms  p99 {times[int(len(times) * 0.99)]:6.2f} ms")
+
+if __name__ == "__main__":
+    for n in (3, 10, 50, 200):
+        run(n)
+    for n in (10, 50, 80):
+        run_route(n)
@@ -0,0 +1,86 @@
+﻿"""Template rendering vs the respond() polish path for structured replies.
+
+Run from the repo root:
+    python -m benchmarks.bench_render [--reps 200] [--llm-latency 250] [--out results.json]
+
+For every place's facts and a few itinerary budgets, times building the
+final reply three ways: the draft through polish_text with the (stub) LLM and
+no cache, the draft through the local regex fallback, and the precompiled
+template. Each includes check_output, as respond() does. LLM cost per 1000
+replies is estimated from prompt/answer size (~4 characters per token) and
+the --price-in/--price-out rates (USD per 1M tokens); the other paths are free.
+"""
+import argparse, json, os, time
+from typing import Callable, List
+from benchmarks.common import print_row, start_stub_llm, summarize, write_results
+
+CHARS_PER_TOKEN = 4.0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--reps", type=int, default=200, help="replies per path and intent")
+    ap.add_argument("--llm-latency", type=float, default=250.0, help="stub LLM response time in ms")
+    ap.add_argument("--price-in", type=float, default=0.15, help="USD per 1M prompt tokens")
+    ap.add_argument("--price-out", type=float, default=0.60, help="USD per 1M completion tokens")
+    ap.add_argument("--out", help="write machine-readable results here (JSON)")
+    args = ap.parse_args(argv)
+
+    stub = start_stub_llm(args.llm_latency)
+    os.environ.update(OPENAI_API_KEY="stub", OPENAI_BASE_URL=f"http://127.0.0.1:{stub.server_port}",
+                      LLM_CACHE_SIZE="0")
+    from agents.dialogue_agent import facts_reply, itinerary_reply, render_facts, render_itinerary
+    from agents.ir_agent import lookup_place
+    from agents.itinerary_agent import plan
+    from agents.safety_agent import check_output
+    from utils import catalogue, llm
+
+    names = catalogue.list_names()
+    closing = "Want **ticket info** or **quick facts** as well?"
+    cases = {
+        "facts": ([lookup_place(n) for n in names], facts_reply, render_facts),
+        "itinerary": ([plan(n, m) for n in names for m in (60, 120, 180)], lambda r: itinerary_reply(r, closing),
+                      lambda r: render_itinerary(r, closing)),
+    }
+
+    def cost_per_1k(drafts: List[str]) -> float:
+        usd = 0.0
+        for d in drafts:
+            prompt = len(json.dumps(llm._messages(d), ensure_ascii=False)) / CHARS_PER_TOKEN
+            answer = min(len(d), 600) / CHARS_PER_TOKEN   # the stub echoes; answers are capped at 600 chars
+            usd += (prompt * args.price_in + answer * args.price_out) / 1e6
+        return round(usd / len(drafts) * 1000, 4)
+
+    def run(name: str, fn: Callable, inputs: List, **extra) -> dict:
+        samples = []
+        t_all = time.perf_counter()
+        for i in range(args.reps):
+            res = inputs[i % len(inputs)]
+            t0 = time.perf_counter()
+            check_output(fn(res))
+            samples.append((time.perf_counter() - t0) * 1000)
+        r = summarize(name, samples, time.perf_counter() - t_all, **extra)
+        print_row(r)
+        return r
+
+    results = []
+    key = llm.OPENAI_API_KEY
+    for intent, (inputs, draft, render) in cases.items():
+        inputs = [r for r in inputs if r and (intent == "facts" or r.get("stops"))]
+        cost = cost_per_1k([draft(r) for r in inputs])
+        llm.OPENAI_API_KEY = key
+        results.append(run(f"render/{intent}/respond_llm", lambda r: llm.polish_text(draft(r)), inputs,
+                           cost_per_1k_usd=cost))
+        llm.OPENAI_API_KEY = None   # polish_text takes the local formatter
+        results.append(run(f"render/{intent}/respond_fallback", lambda r: llm.polish_text(draft(r)), inputs,
+                           cost_per_1k_usd=0.0))
+        results.append(run(f"render/{intent}/template", render, inputs, cost_per_1k_usd=0.0))
+    llm.OPENAI_API_KEY = key
+    for r in results:
+        print(f"{r['name']:<44} ${r['cost_per_1k_usd']:.4f} per 1000 replies")
+    write_results(args.out, "render", results, vars(args))
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
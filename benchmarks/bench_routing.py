@@ -0,0 +1,84 @@
+﻿"""route_intent cost per message: per-family substring loops vs the trigger automaton vs the memo.
+
+Run from the repo root:  python -m benchmarks.bench_routing
+
+Also checks that every routing decision (intent and payload) matches the
+legacy implementation over the chip strings plus a seeded random corpus.
+"""
+import random, re, time
+from statistics import median
+from agents.dialogue_agent import (CHITCHAT_TRIGGERS, FACTS_TRIGGERS, PLAN_TRIGGERS, _extract_city,
+                                   _route, parse_minutes, route_cache_info, route_intent)
+
+MESSAGES = [
+    "Tell me about Sigiriya",
+    "Plan a 3-hour tour in Kandy",
+    "Plan a 2-hour tour in Galle",
+    "Ticket price in Kandy",
+    "Facts about Galle",
+    "Plan another city",
+    "Another city",
+    "Help",
+    "hi",
+    "2 hours",
+    "Ella",
+    "what's up",
+    "plan about kandy",
+    "Can you make a route plan around Nuwara Eliya for 150 minutes with tea factory visits?",
+    "where is adam's peak and when should I climb it to see the sunrise",
+    "I have a long layover in Colombo, what can I see in about four hours near Galle Face Green?",
+]
+
+def legacy_route(text: str):
+    t = (text or "").lower().strip()
+    if any(k in t for k in ("help", "how to use", "what can you do")):
+        return "help", {}
+    if any(k in t for k in PLAN_TRIGGERS):
+        return "itinerary", {"city": _extract_city(text), "minutes": parse_minutes(text)}
+    if any(k in t for k in FACTS_TRIGGERS):
+        place = None
+        if "about" in t:
+            place = text.lower().split("about", 1)[1]
+        place = (place or text).strip(" ?!.")
+        return "facts", {"place": place}
+    if any(k in t for k in CHITCHAT_TRIGGERS):
+        return "chitchat", {}
+    words = [w for w in re.split(r"\s+", t) if w]
+    if 1 <= len(words) <= 3:
+        return "facts", {"place": text.strip(" ?!.")}
+    return "unknown", {}
+
+def corpus(n: int = 20000, seed: int = 7):
+    vocab = ("plan tour itinerary route schedule in at for around kandy galle ella sigiriya tell me about "
+             "what is where ticket price facts history hi hello hey help how to use good morning whats up "
+             "2h 90 minutes 3-hour the a this chip thing shipping").split()
+    rnd = random.Random(seed)
+    out = list(MESSAGES) + [""]
+    for _ in range(n):
+        out.append(" ".join(rnd.choices(vocab, k=rnd.randint(0, 8))) + rnd.choice(["", "?", "!", ".", " "]))
+        out.append("".join(rnd.choices("abcdehilmnoprstuy .?", k=rnd.randint(0, 16))))
+    return out
+
+def bench(label: str, fn, rounds: int = 200):
+    samples = []
+    for _ in range(rounds):
+        for m in MESSAGES:
+            t0 = time.perf_counter()
+            fn(m)
+            samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<18} p50 {median(samples):9.2f} us  p99 {p99:9.2f} us")
+
+if __name__ == "__main__":
+    checked = 0
+    for m in corpus():
+        intent, payload = route_intent(m)
+        assert (intent, dict(payload)) == legacy_route(m), m
+        checked += 1
+    print(f"{checked} routing decisions match the legacy router")
+    _route.cache_clear()
+    bench("legacy", legacy_route)
+    bench("automaton", _route.__wrapped__)
+    bench("memoized", route_intent)
+    print("memo", route_cache_info())
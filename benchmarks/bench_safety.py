@@ -0,0 +1,52 @@
+﻿"""check_input cost per message: library profanity scan + substring loop vs the compiled matcher.
+
+Run from the repo root:  python -m benchmarks.bench_safety
+"""
+import re, time
+from statistics import median
+from better_profanity import profanity
+from agents.safety_agent import BANNED_SUBSTRINGS, check_input
+
+MESSAGES = [
+    "Tell me about Sigiriya",
+    "Plan a 3-hour tour in Kandy",
+    "hi",
+    "What is the ticket price for the Temple of the Tooth?",
+    "Plan a 2-hour tour in Galle",
+    "2 hours",
+    "Can you make a route plan around Nuwara Eliya for 150 minutes with tea factory visits?",
+    "where is adam's peak and when should I climb it to see the sunrise",
+    "help",
+    "<script>alert(1)</script>",
+    "how do I hack the ticket machine",
+    "this tour is sh1t",
+    "Ella",
+    "I have a long layover in Colombo, what can I see in about four hours near Galle Face Green?",
+]
+
+def legacy_check(t: str):
+    if profanity.contains_profanity(t):
+        return False, "profanity"
+    low = t.lower()
+    for bad in BANNED_SUBSTRINGS:
+        if bad in low:
+            return False, bad
+    if ("<" in t or ">" in t) and re.search(r"<\s*\/?\s*[a-z][a-z0-9\-]*\s*[^>]*>", t, re.I):
+        return False, "raw_html_tag"
+    return True, ""
+
+def bench(label: str, fn, rounds: int = 20):
+    samples = []
+    for _ in range(rounds):
+        for m in MESSAGES:
+            t0 = time.perf_counter()
+            fn(m)
+            samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<18} p50 {median(samples):9.1f} us  p99 {p99:9.1f} us")
+
+if __name__ == "__main__":
+    assert all(legacy_check(m) == check_input(m) for m in MESSAGES)
+    bench("legacy", legacy_check)
+    bench("compiled matcher", check_input)
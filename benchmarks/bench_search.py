@@ -0,0 +1,50 @@
+﻿"""Latency of ir_agent.search on synthetic catalogues.
+
+Run from the repo root:  python -m benchmarks.bench_search
+"""
+import random, time
+from itertools import accumulate
+from statistics import median
+from agents.ir_agent import SearchIndex
+from utils.catalogue import Catalogue
+
+WORDS = ("temple fort beach lake safari elephant tea hill falls museum rock cave "
+         "stupa colonial lighthouse surf whale garden park ruins palace market "
+         "sunrise trail bridge lagoon shrine reservoir heritage unesco ancient").split()
+
+def synthetic_places(n: int, seed: int = 7) -> dict:
+    rnd = random.Random(seed)
+    # long-tailed vocabulary: a few common travel words plus many rare ones
+    vocab = WORDS + [f"w{i}" for i in range(5000)]
+    cum = list(accumulate(1.0 / (r + 1) for r in range(len(vocab))))
+    words = iter(rnd.choices(vocab, cum_weights=cum, k=n * 30))
+    take = lambda k: " ".join(next(words) for _ in range(k))
+    places = {}
+    for i in range(n):
+        name = f"{rnd.choice(WORDS).title()} {rnd.choice(WORDS).title()} {i}"
+        places[name] = {
+            "city": f"City{i % 500}",
+            "highlights": [take(3) for _ in range(2)],
+            "facts": [take(8) for _ in range(3)],
+        }
+    return places
+
+def bench(n: int, queries: int = 200):
+    places = synthetic_places(n)
+    t0 = time.perf_counter()
+    index = SearchIndex(Catalogue.from_dict(places))
+    build_ms = (time.perf_counter() - t0) * 1000
+    rnd = random.Random(n)
+    samples = []
+    for _ in range(queries):
+        q = " ".join(rnd.choices(WORDS, k=rnd.randint(1, 3)))
+        t0 = time.perf_counter()
+        index.search(q)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{n:>7} places  build {build_ms:8.1f} ms  p50 {median(samples):7.3f} ms  p99 {p99:7.3f} ms")
+
+if __name__ == "__main__":
+    for n in (1_000, 10_000, 100_000):
+        bench(n)
@@ -0,0 +1,92 @@
+﻿"""Per-request session overhead: signed cookie vs in-process LRU vs SQLite store.
+
+Run from the repo root:  python -m benchmarks.bench_sessions
+
+Each simulated user walks the slot-filling turns (read pending/slots, write
+them back) against a minimal Flask app behind werkzeug's threaded server, as
+in production: every request arrives on a new connection and so runs on a new
+thread, which is what per-thread state (e.g. a SQLite connection) pays for.
+Users run sequentially and from several client threads.
+"""
+import http.client, logging, os, tempfile, threading, time
+from statistics import median
+from flask import Flask, jsonify, session
+from werkzeug.serving import make_server
+from utils import sessions
+
+USERS = 50
+TURNS = 40
+THREADS = 8
+
+def make_app(kind: str, path: str) -> Flask:
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "bench"
+    if kind != "cookie":
+        app.session_interface = sessions.ServerSessionInterface(sessions.make_store(kind, path))
+
+    @app.post("/login")
+    def login():
+        session["user"] = "admin"
+        session["pending"] = None
+        session["slots"] = {}
+        return "ok"
+
+    @app.post("/turn")
+    def turn():
+        pending = session.get("pending")
+        slots = session.get("slots", {})
+        if pending == "city":
+            slots["city"] = "Kandy"
+            session["pending"], session["slots"] = "minutes", slots
+        elif pending == "minutes":
+            session["pending"], session["slots"] = None, {}
+        else:
+            session["pending"], session["slots"] = "city", {}
+        return jsonify(slots)
+
+    return app
+
+def post(port: int, path: str, cookie: str = "") -> str:
+    """One request on a fresh connection; returns the session cookie it set (if any)."""
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    conn.request("POST", path, headers={"Cookie": cookie} if cookie else {})
+    res = conn.getresponse()
+    res.read()
+    conn.close()
+    return (res.getheader("Set-Cookie") or "").split(";")[0]
+
+def user(port: int, samples: list):
+    cookie = post(port, "/login")
+    for _ in range(TURNS):
+        t0 = time.perf_counter()
+        cookie = post(port, "/turn", cookie) or cookie
+        samples.append((time.perf_counter() - t0) * 1e6)
+
+def run(kind: str, threads: int):
+    with tempfile.TemporaryDirectory() as d:
+        app = make_app(kind, os.path.join(d, "sessions.sqlite3"))
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        samples: list = []
+        cookie = post(server.port, "/login")
+        per_thread = USERS // threads
+        t0 = time.perf_counter()
+        workers = [threading.Thread(target=lambda: [user(server.port, samples) for _ in range(per_thread)])
+                   for _ in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - t0
+        server.shutdown()
+        server.server_close()
+    samples.sort()
+    p99 = samples[int(len(samples) * 0.99)]
+    print(f"{kind:<7} {threads:>2} threads  p50 {median(samples):7.1f} us  p99 {p99:8.1f} us  "
+          f"{len(samples) / elapsed:7.0f} req/s  cookie {len(cookie):3d} bytes")
+
+if __name__ == "__main__":
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)   # no access log
+    for kind in ("cookie", "memory", "sqlite"):
+        for threads in (1, THREADS):
+            run(kind, threads)
@@ -0,0 +1,33 @@
+﻿"""Build time and lookup latency of ir_agent.SimilarIndex on synthetic catalogues.
+
+Run from the repo root:  python -m benchmarks.bench_similar
+"""
+import random, sys, time
+from statistics import median
+from agents.ir_agent import SimilarIndex
+from benchmarks.bench_search import synthetic_places
+from utils.catalogue import Catalogue
+
+def bench(n: int, lookups: int = 2000):
+    cat = Catalogue.from_dict(synthetic_places(n))
+    t0 = time.perf_counter()
+    index = SimilarIndex(cat)
+    build_s = time.perf_counter() - t0
+    names = list(cat)
+    rnd = random.Random(n)
+    samples = []
+    for _ in range(lookups):
+        name = rnd.choice(names)
+        t0 = time.perf_counter()
+        index.similar(name, 3)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    table_kb = (index.ids.itemsize * len(index.ids) + index.scores.itemsize * len(index.scores)) / 1024
+    print(f"{n:>7} places  build {build_s:8.2f} s  table {table_kb:8.0f} KiB  "
+          f"lookup p50 {median(samples):6.2f} us  p99 {p99:6.2f} us")
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    for n in sizes:
+        bench(n)
@@ -0,0 +1,95 @@
+﻿"""Shared pieces for the benchmark suite: latency summaries, machine-readable
+results, and a local stand-in for the LLM API.
+
+Result files are JSON:
+    {"suite": ..., "meta": {"commit", "python", "platform", "time", "args"},
+     "results": [{"name", "n", "p50_ms", "p99_ms", "mean_ms", "max_ms", "throughput_rps"?}, ...]}
+Compare two of them with `python -m benchmarks.compare old.json new.json`.
+"""
+import json, platform, socket, subprocess, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from statistics import mean
+from typing import Any, Dict, List, Optional
+
+
+def summarize(name: str, samples_ms: List[float], elapsed_s: Optional[float] = None, **extra) -> Dict[str, Any]:
+    s = sorted(samples_ms)
+    pick = lambda q: s[min(len(s) - 1, int(len(s) * q))] if s else 0.0
+    out = {"name": name, "n": len(s), "p50_ms": round(pick(0.50), 4), "p99_ms": round(pick(0.99), 4),
+           "mean_ms": round(mean(s), 4) if s else 0.0, "max_ms": round(s[-1], 4) if s else 0.0}
+    if elapsed_s:
+        out["throughput_rps"] = round(len(s) / elapsed_s, 1)
+    out.update(extra)
+    return out
+
+
+def print_row(r: Dict[str, Any]):
+    tput = f"  {r['throughput_rps']:9.1f} req/s" if "throughput_rps" in r else ""
+    print(f"{r['name']:<44} n={r['n']:<6} p50 {r['p50_ms']:9.3f} ms  p99 {r['p99_ms']:9.3f} ms{tput}")
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(path: Optional[str], suite: str, results: List[Dict[str, Any]], args: Dict[str, Any]):
+    if not path:
+        return
+    doc = {"suite": suite,
+           "meta": {"commit": _commit(), "python": sys.version.split()[0], "platform": platform.platform(),
+                    "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "args": args},
+           "results": results}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2)
+    print(f"wrote {path}", file=sys.stderr)
+
+
+# ---------- stub LLM ----------
+class _StubLLM(BaseHTTPRequestHandler):
+    """OpenAI-style /chat/completions that echoes the text after `latency` seconds
+    (streamed as a few chunks when asked to)."""
+
+    latency = 0.0
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        text = body.get("messages", [{}])[-1].get("content", "").split("Text to rewrite:\n", 1)[-1]
+        time.sleep(self.latency)
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            words = text.split(" ")
+            step = max(1, len(words) // 4)
+            for i in range(0, len(words), step):
+                delta = " ".join(words[i:i + step]) + " "
+                self.wfile.write(f"data: {json.dumps({'choices': [{'delta': {'content': delta}}]})}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+            return
+        data = json.dumps({"choices": [{"message": {"content": text}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_stub_llm(latency_ms: float = 0.0) -> ThreadingHTTPServer:
+    """Serve the stub on 127.0.0.1 (random port) in a daemon thread."""
+    handler = type("StubLLM", (_StubLLM,), {"latency": latency_ms / 1000.0})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    # headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per call
+    server.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server
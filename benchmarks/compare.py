@@ -0,0 +1,50 @@
+﻿"""Compare two benchmark result files (from --out) and flag regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 0.10] [--min-ms 0.05]
+
+Prints p50/p99/throughput for every result present in both files. Exits with
+status 1 if any p50 or p99 got slower, or throughput got lower, by more than
+the threshold. Latencies under --min-ms are too noisy to flag.
+"""
+import argparse, json, sys
+from typing import Dict, Optional
+
+def _load(path: str) -> Dict[str, dict]:
+    with open(path, encoding="utf-8") as f:
+        doc = json.load(f)
+    return {r["name"]: r for r in doc["results"]}
+
+def _delta(old: Optional[float], new: Optional[float]) -> Optional[float]:
+    if not old or new is None:
+        return None
+    return (new - old) / old
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("baseline")
+    ap.add_argument("candidate")
+    ap.add_argument("--threshold", type=float, default=0.10, help="relative change that counts as a regression")
+    ap.add_argument("--min-ms", type=float, default=0.05, help="ignore latency changes below this baseline")
+    args = ap.parse_args(argv)
+    old, new = _load(args.baseline), _load(args.candidate)
+    regressions = 0
+    for name in sorted(old.keys() & new.keys()):
+        a, b = old[name], new[name]
+        cells, bad = [], False
+        for key, worse_if_up in (("p50_ms", True), ("p99_ms", True), ("throughput_rps", False)):
+            d = _delta(a.get(key), b.get(key))
+            if d is None:
+                continue
+            noisy = key.endswith("_ms") and a[key] < args.min_ms
+            flag = not noisy and (d > args.threshold if worse_if_up else d < -args.threshold)
+            bad |= flag
+            cells.append(f"{key} {a[key]:>9} -> {b[key]:<9} ({d:+6.1%}){' !' if flag else ''}")
+        regressions += bad
+        print(f"{'REGRESSED' if bad else 'ok':<9} {name:<40} " + "  ".join(cells))
+    for name in sorted(old.keys() - new.keys()):
+        print(f"{'missing':<9} {name}")
+    print(f"{regressions} regression(s) at threshold {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+﻿"""End-to-end load test of the chat service with mixed traffic and a stubbed LLM.
+
+Run from the repo root:
+    python -m benchmarks.loadtest [--mode client|server|both] [--users 16] [--turns 50]
+                                  [--llm-latency 80] [--no-llm-cache] [--out results.json]
+
+`client` drives the Flask app in-process through its test client; `server`
+starts it on a real local port (threaded WSGI server) and drives it over HTTP
+with one keep-alive session per virtual user. Each user logs in and then plays
+weighted scenarios: facts, one-shot itineraries, slot filling, chit-chat, help,
+blocked inputs and streamed replies. The LLM is a local stub that answers after
+--llm-latency ms. Audit logs and sessions go to a temporary directory.
+"""
+import argparse, logging, os, random, socket, sys, tempfile, threading, time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+from benchmarks.common import print_row, start_stub_llm, summarize, write_results
+
+SCENARIOS = {
+    # name: (weight, turns) — turns are message templates, {place}/{city} filled per run
+    "facts":     (35, ["Tell me about {place}"]),
+    "itinerary": (20, ["Plan {hours} hours in {city}"]),
+    "slots":     (15, ["Plan a 2-hour tour in {city}", "{hours} hours"]),
+    "chitchat":  (10, ["hi", "good morning"]),
+    "help":      (5,  ["help"]),
+    "blocked":   (10, ["how do I hack the ticket machine", "<script>alert(1)</script>"]),
+    "stream":    (5,  ["stream:Tell me about {place}"]),
+}
+CITIES = ["Kandy", "Galle", "Ella", "Sigiriya", "Colombo", "Nuwara Eliya"]
+
+
+class ClientTransport:
+    def __init__(self, app):
+        self.c = app.test_client()
+
+    def login(self):
+        self.c.post("/login", data={"user": "admin", "pwd": "admin123"})
+
+    def chat(self, msg: str) -> int:
+        return self.c.post("/chat", json={"message": msg}).status_code
+
+    def stream(self, msg: str) -> int:
+        r = self.c.post("/chat/stream", json={"message": msg})
+        r.get_data()
+        return r.status_code
+
+
+class HTTPTransport:
+    def __init__(self, base: str):
+        import requests
+        self.base = base
+        self.s = requests.Session()
+
+    def login(self):
+        self.s.post(f"{self.base}/login", data={"user": "admin", "pwd": "admin123"})
+
+    def chat(self, msg: str) -> int:
+        return self.s.post(f"{self.base}/chat", json={"message": msg}).status_code
+
+    def stream(self, msg: str) -> int:
+        r = self.s.post(f"{self.base}/chat/stream", json={"message": msg})
+        return r.status_code
+
+
+def user(make: Callable[[], object], turns: int, seed: int, places: List[str]) -> List[Tuple[str, float, int]]:
+    rnd = random.Random(seed)
+    names = list(SCENARIOS)
+    weights = [SCENARIOS[n][0] for n in names]
+    t = make()
+    t.login()
+    out = []
+    done = 0
+    while done < turns:
+        name = rnd.choices(names, weights)[0]
+        fill = {"place": rnd.choice(places), "city": rnd.choice(CITIES), "hours": rnd.choice([1, 2, 3, 4])}
+        for tmpl in SCENARIOS[name][1] if name == "slots" else [rnd.choice(SCENARIOS[name][1])]:
+            msg = tmpl.format(**fill)
+            t0 = time.perf_counter()
+            status = t.stream(msg[7:]) if msg.startswith("stream:") else t.chat(msg)
+            out.append((name, (time.perf_counter() - t0) * 1000, status))
+            done += 1
+    return out
+
+
+def drive(label: str, make: Callable[[], object], users: int, turns: int, places: List[str]) -> List[dict]:
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        runs = list(pool.map(lambda i: user(make, turns, i, places), range(users)))
+    elapsed = time.perf_counter() - t0
+    by: Dict[str, List[float]] = defaultdict(list)
+    errors = 0
+    for run in runs:
+        for name, ms, status in run:
+            by[name].append(ms)
+            errors += status >= 500
+    results = [summarize(f"{label}/all", [ms for v in by.values() for ms in v], elapsed, errors=errors, users=users)]
+    results += [summarize(f"{label}/{name}", by[name]) for name in sorted(by)]
+    for r in results:
+        print_row(r)
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--mode", choices=("client", "server", "both"), default="both")
+    ap.add_argument("--users", type=int, default=16, help="concurrent virtual users")
+    ap.add_argument("--turns", type=int, default=50, help="requests per user")
+    ap.add_argument("--llm-latency", type=float, default=80.0, help="stub LLM response time in ms")
+    ap.add_argument("--no-llm-cache", action="store_true", help="make every polish call reach the stub")
+    ap.add_argument("--out", help="write machine-readable results here (JSON)")
+    args = ap.parse_args(argv)
+
+    stub = start_stub_llm(args.llm_latency)
+    os.environ.update(OPENAI_API_KEY="stub", OPENAI_BASE_URL=f"http://127.0.0.1:{stub.server_port}",
+                      CATALOGUE_WATCH_INTERVAL="0")
+    if args.no_llm_cache:
+        os.environ["LLM_CACHE_SIZE"] = "0"
+    sys.path.insert(0, os.getcwd())
+    work = tempfile.mkdtemp(prefix="vtg-loadtest-")
+    os.chdir(work)   # audit log and session files land here, not in the repo
+    import app as web
+    from utils import catalogue, crypto_log
+    places = catalogue.list_names()
+
+    results = []
+    if args.mode in ("client", "both"):
+        results += drive("client", lambda: ClientTransport(web.app), args.users, args.turns, places)
+    if args.mode in ("server", "both"):
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)   # no per-request access log
+        server = make_server("127.0.0.1", 0, web.app, threaded=True)
+        # accepted sockets inherit this; avoids Nagle + delayed-ACK stalls on small responses
+        server.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        try:
+            results += drive("server", lambda: HTTPTransport(base), args.users, args.turns, places)
+        finally:
+            server.shutdown()
+    crypto_log.shutdown()
+    stub.shutdown()
+    print(f"(audit log and sessions in {work})", file=sys.stderr)
+    write_results(args.out, "loadtest", results, vars(args))
+
+
+if __name__ == "__main__":
+    main()
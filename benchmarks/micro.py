@@ -0,0 +1,99 @@
+﻿"""Microbenchmarks of the hot agent functions on synthetic catalogues of growing size.
+
+Run from the repo root:
+    python -m benchmarks.micro [--sizes 100 1000 10000] [--reps 300] [--out results.json]
+
+Covers _best_match, search, route_intent (memo cold and warm), check_input,
+plan and write_event (request-path cost of queueing an audit event). Index
+build time for each size is reported separately.
+"""
+import argparse, os, random, tempfile, time
+from typing import Callable, Dict, List
+from benchmarks.bench_safety import MESSAGES
+from benchmarks.bench_search import WORDS, synthetic_places
+from benchmarks.common import print_row, summarize, write_results
+from agents import ir_agent, itinerary_agent
+from agents.dialogue_agent import _route, route_intent
+from agents import safety_agent
+from agents.safety_agent import check_input
+from utils import catalogue, crypto_log
+from utils.catalogue import Catalogue
+
+def with_stops(places: Dict[str, dict], seed: int = 11) -> Dict[str, dict]:
+    rnd = random.Random(seed)
+    for name, entry in places.items():
+        entry["stops"] = [{"name": f"{name} stop {j}", "minutes": rnd.choice([15, 30, 45, 60, 90])}
+                          for j in range(rnd.randint(2, 8))]
+    return places
+
+def measure(fn: Callable, inputs: List, reps: int) -> List[float]:
+    samples = []
+    for i in range(reps):
+        arg = inputs[i % len(inputs)]
+        t0 = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+def run_size(n: int, reps: int, rnd: random.Random) -> List[dict]:
+    places = with_stops(synthetic_places(n))
+    names = list(places)
+    cat = Catalogue.from_dict(places)
+    t0 = time.perf_counter()
+    for key, build in catalogue.INDEX_BUILDERS.items():
+        cat.derived(key, build)
+    build_ms = (time.perf_counter() - t0) * 1000
+    catalogue._current = cat
+
+    lookups = ([rnd.choice(names) for _ in range(50)]                        # exact
+               + [rnd.choice(names).lower()[:12] for _ in range(50)]         # prefix
+               + [rnd.choice(names)[:-2] + "xx" for _ in range(20)]          # typo
+               + ["nowhere at all", "zzzz"])                                 # miss
+    queries = [" ".join(rnd.choices(WORDS, k=rnd.randint(1, 3))) for _ in range(100)]
+    cities = [rnd.choice(names) for _ in range(100)]
+    budgets = [(c, rnd.choice([60, 90, 120, 150, 180, 200, 240])) for c in cities]
+    chat = [f"Tell me about {rnd.choice(names)}" for _ in range(100)] + [f"Plan 2 hours in {c}" for c in cities]
+
+    tag = f"{n}"
+    safety_agent.MATCHER   # built lazily (utils.startup); keep its one-off build out of the samples
+    results = [
+        summarize(f"micro/{tag}/_best_match", measure(ir_agent._best_match, lookups, reps)),
+        summarize(f"micro/{tag}/search", measure(ir_agent.search, queries, reps)),
+        summarize(f"micro/{tag}/route_intent_cold", measure(_route.__wrapped__, chat, reps)),
+        summarize(f"micro/{tag}/route_intent_warm", measure(route_intent, chat[:20], reps)),
+        summarize(f"micro/{tag}/check_input", measure(check_input, MESSAGES + chat[:20], reps)),
+        summarize(f"micro/{tag}/plan", measure(lambda cb: itinerary_agent.plan(*cb), budgets, reps)),
+    ]
+    results[0]["index_build_ms"] = round(build_ms, 1)
+    return results
+
+def run_write_event(reps: int) -> List[dict]:
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "audit.log")
+        events = [{"agent": "dialogue", "intent": "facts", "payload": {"place": f"P{i}"}} for i in range(50)]
+        out = [summarize("micro/write_event", measure(lambda e: crypto_log.write_event(e, path), events, reps))]
+        crypto_log.shutdown()
+    return out
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000])
+    ap.add_argument("--reps", type=int, default=300, help="calls per function and size")
+    ap.add_argument("--out", help="write machine-readable results here (JSON)")
+    args = ap.parse_args(argv)
+    rnd = random.Random(5)
+    results = []
+    for n in args.sizes:
+        rows = run_size(n, args.reps, rnd)
+        print(f"-- {n} places (indexes built in {rows[0]['index_build_ms']} ms)")
+        for r in rows:
+            print_row(r)
+        results += rows
+    rows = run_write_event(args.reps)
+    for r in rows:
+        print_row(r)
+    results += rows
+    write_results(args.out, "micro", results, vars(args))
+
+if __name__ == "__main__":
+    main()
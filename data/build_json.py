@@ -1,30 +1,43 @@
-﻿import csv, json, os
+﻿import argparse, csv, hashlib, importlib, json, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parent.parent
 json_path = ROOT / "data" / "places.json"
 csv_path = ROOT / "data" / "sri_lanka_places.csv"
+snapshot_path = ROOT / "data" / "places.bin"
+hashes_path = ROOT / "data" / "places.hashes.json"  # per-place CSV row hash, for --incremental
 
-# Load existing JSON (tolerate BOM)
-data = {}
-if json_path.exists():
-    txt = json_path.read_text(encoding="utf-8-sig")
-    try:
-        data = json.loads(txt)
-    except Exception as e:
-        raise SystemExit(f"Failed to parse {json_path}: {e}")
+def load_json():
+    # Load existing JSON (tolerate BOM)
+    data = {}
+    if json_path.exists():
+        txt = json_path.read_text(encoding="utf-8-sig")
+        try:
+            data = json.loads(txt)
+        except Exception as e:
+            raise SystemExit(f"Failed to parse {json_path}: {e}")
+    return data
 
 def row_to_entry(r):
     def as_int(x, default=0):
         try: return int(str(x).strip())
         except: return default
+    def as_float(x):
+        try: return float(str(x).strip())
+        except: return None
     stops = []
-    if r.get("stop1"):
-        stops.append({"name": r["stop1"].strip(), "minutes": as_int(r.get("stop1_minutes"), 45)})
-    if r.get("stop2"):
-        stops.append({"name": r["stop2"].strip(), "minutes": as_int(r.get("stop2_minutes"), 45)})
-    if r.get("stop3"):
-        stops.append({"name": r["stop3"].strip(), "minutes": as_int(r.get("stop3_minutes"), 45)})
+    for i in (1, 2, 3):
+        if r.get(f"stop{i}"):
+            stop = {"name": r[f"stop{i}"].strip(), "minutes": as_int(r.get(f"stop{i}_minutes"), 45)}
+            priority = as_float(r.get(f"stop{i}_priority"))  # optional column
+            if priority is not None:
+                stop["priority"] = priority
+            lat, lon = as_float(r.get(f"stop{i}_lat")), as_float(r.get(f"stop{i}_lon"))  # optional columns
+            if lat is not None and lon is not None:
+                stop["lat"], stop["lon"] = lat, lon
+            stops.append(stop)
     facts = [r.get("fact1","").strip(), r.get("fact2","").strip(), r.get("fact3","").strip()]
     facts = [f for f in facts if f]
     return {
@@ -33,15 +46,118 @@ def row_to_entry(r):
         "stops": stops
     }
 
-# Merge CSV rows
-with csv_path.open("r", encoding="utf-8-sig", newline="") as f:
-    reader = csv.DictReader(f)
-    for r in reader:
-        place = (r.get("place") or "").strip()
-        if not place: 
-            continue
-        data[place] = row_to_entry(r)
-
-# Save pretty JSON (no BOM)
-json_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-print(f"Wrote {json_path} with {len(data)} places")
+def row_hash(r):
+    return hashlib.sha1("\x1f".join(f"{k}={v}" for k, v in sorted(r.items(), key=lambda kv: str(kv[0]))).encode("utf-8")).hexdigest()
+
+def validate_rows(rows):
+    """Convert a chunk of (place, row) pairs; returns (place, entry, problems) tuples."""
+    out = []
+    for place, r in rows:
+        problems = []
+        for i in (1, 2, 3):
+            m = (r.get(f"stop{i}_minutes") or "").strip()
+            if r.get(f"stop{i}") and m and not m.isdigit():
+                problems.append(f"stop{i}_minutes={m!r}")
+            lat, lon = (r.get(f"stop{i}_lat") or "").strip(), (r.get(f"stop{i}_lon") or "").strip()
+            if bool(lat) != bool(lon):
+                problems.append(f"stop{i} needs both lat and lon")
+        entry = row_to_entry(r)
+        if not entry["facts"]:
+            problems.append("no facts")
+        out.append((place, entry, problems))
+    return out
+
+def merge_csv(data):
+    # Merge CSV rows
+    hashes = {}
+    with csv_path.open("r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        for r in reader:
+            place = (r.get("place") or "").strip()
+            if not place: 
+                continue
+            data[place] = row_to_entry(r)
+            hashes[place] = row_hash(r)
+    return data, hashes
+
+def merge_csv_incremental(data, hashes, chunk_size=10_000, workers=None):
+    """Stream the CSV in chunks; only rows whose hash changed are validated (in a
+    process pool) and merged. Returns the number of places that changed."""
+    rows = seen = changed = 0
+    started = time.perf_counter()
+    with csv_path.open("r", encoding="utf-8-sig", newline="") as f, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        reader = csv.DictReader(f)
+        while True:
+            chunk = list(islice(reader, chunk_size))
+            if not chunk:
+                break
+            rows += len(chunk)
+            todo = []
+            for r in chunk:
+                place = (r.get("place") or "").strip()
+                if not place:
+                    continue
+                seen += 1
+                h = row_hash(r)
+                if hashes.get(place) != h or place not in data:
+                    hashes[place] = h
+                    todo.append((place, r))
+            # split the changed rows so every worker gets a share
+            step = max(1, -(-len(todo) // (workers or os.cpu_count() or 1)))
+            parts = [todo[i:i + step] for i in range(0, len(todo), step)]
+            for result in pool.map(validate_rows, parts):
+                for place, entry, problems in result:
+                    if problems:
+                        print(f"warning: {place}: {', '.join(problems)}", file=sys.stderr)
+                    data[place] = entry
+                    changed += 1
+    elapsed = time.perf_counter() - started
+    print(f"Read {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s): "
+          f"{changed} changed, {seen - changed} unchanged")
+    return changed
+
+def write_atomic(path, text):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+def write_snapshot(data, only_if_stale=False):
+    """Binary snapshot (offset table + precomputed indexes) that the agents mmap."""
+    sys.path.insert(0, str(ROOT))
+    from utils import catalogue
+    for module in ("agents.ir_agent", "agents.itinerary_agent"):
+        importlib.import_module(module)   # registers their index builders
+    if only_if_stale and catalogue.open_snapshot(str(snapshot_path), str(json_path)) is not None:
+        return
+    catalogue.write_snapshot(data, str(snapshot_path), str(json_path), catalogue.INDEX_BUILDERS)
+    print(f"Wrote {snapshot_path} ({snapshot_path.stat().st_size} bytes)")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Merge the places CSV into places.json.")
+    ap.add_argument("--snapshot", action="store_true",
+                    help="also write data/places.bin, a memory-mappable snapshot for the agents")
+    ap.add_argument("--incremental", action="store_true",
+                    help="stream the CSV and only re-validate rows that changed since the last run")
+    ap.add_argument("--chunk-size", type=int, default=10_000)
+    ap.add_argument("--workers", type=int, default=None, help="validation processes (default: CPU count)")
+    args = ap.parse_args(argv)
+    data = load_json()
+    if args.incremental:
+        hashes = json.loads(hashes_path.read_text(encoding="utf-8")) if hashes_path.exists() else {}
+        if not merge_csv_incremental(data, hashes, args.chunk_size, args.workers):
+            print(f"{json_path} is up to date ({len(data)} places)")
+            if args.snapshot:
+                write_snapshot(data, only_if_stale=True)
+            return
+    else:
+        data, hashes = merge_csv(data)
+    # Save pretty JSON (no BOM)
+    write_atomic(json_path, json.dumps(data, ensure_ascii=False, indent=2))
+    write_atomic(hashes_path, json.dumps(hashes))
+    print(f"Wrote {json_path} with {len(data)} places")
+    if args.snapshot:
+        write_snapshot(data)
+
+if __name__ == "__main__":
+    main()
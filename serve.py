@@ -0,0 +1,200 @@
+﻿"""Production launcher: build shared state once, then fork workers.
+
+    python serve.py [--host 0.0.0.0] [--port 8000] [--workers 4] [--max-requests 10000]
+
+The parent imports the app with STARTUP_MODE=eager (admin hash, safety
+matcher, catalogue and every registered index), runs the suggestion-chip
+queries through the agents to fill the route/lookup/plan caches, freezes the
+GC and opens the listening socket. Forked workers share all of that
+copy-on-write and accept from the same socket. A worker exits after
+`--max-requests` requests (with jitter, so they do not all recycle at once)
+and is replaced. SIGTERM/SIGINT stop the workers gracefully: in-flight
+requests finish and queued audit events are flushed. Responses are
+sent with Connection: close (werkzeug does not keep connections alive), so no
+idle connection is cut when a worker recycles.
+
+Each worker has its own metrics, caches and catalogue watcher. SESSION_STORE
+defaults to sqlite: in-memory sessions would be neither shared between workers
+nor kept when one recycles.
+"""
+import argparse, gc, logging, os, random, re, signal, sys, threading, time
+from typing import Dict, Iterable, List, Optional
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "index.html")
+CHIP_PAT = re.compile(r'data-fill="([^"]+)"')
+
+
+def chip_queries(template: str = TEMPLATE) -> List[str]:
+    """The static chips on the chat page plus the follow-up chips the server suggests."""
+    try:
+        with open(template, encoding="utf-8-sig") as f:
+            queries = CHIP_PAT.findall(f.read())
+    except OSError:
+        queries = []
+    from app import suggest_for
+    from agents.safety_agent import sanitize
+    from agents.dialogue_agent import route_intent
+    queries += suggest_for("help")
+    seen, out = set(), []
+    for q in queries:
+        intent, payload = route_intent(sanitize(q))
+        for follow in [q] + suggest_for(intent, dict(payload)):
+            if follow not in seen:
+                seen.add(follow)
+                out.append(follow)
+    return out
+
+
+def warm_caches(queries: Iterable[str]) -> int:
+    """Run each query through the agents (no LLM, no audit log); returns how many were handled."""
+    from agents.safety_agent import check_input, sanitize
+    from agents.dialogue_agent import route_intent
+    from agents.ir_agent import lookup_place
+    from agents.itinerary_agent import plan
+    n = 0
+    for q in queries:
+        if not check_input(q)[0]:
+            continue
+        intent, payload = route_intent(sanitize(q))
+        if intent == "facts" and payload.get("place"):
+            lookup_place(payload["place"])
+        elif intent == "itinerary" and payload.get("city"):
+            plan(payload["city"], int(payload.get("minutes") or 180))
+        n += 1
+    return n
+
+
+class _Budget:
+    """WSGI middleware counting requests; calls `on_spent` once `limit` have started."""
+
+    def __init__(self, app, limit: int, on_spent):
+        self.app = app
+        self.limit = limit
+        self.on_spent = on_spent
+        self.served = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.served += 1
+            spent = self.served == self.limit
+        if spent:
+            self.on_spent()
+        return self.app(environ, start_response)
+
+
+def _worker(server, budget: _Budget, watch_interval: float, graceful: float):
+    """Child process body: serve until told to stop, finish requests, flush audit events."""
+    from utils import catalogue, crypto_log
+    stopping = threading.Event()
+
+    def stop(*_):
+        if not stopping.is_set():
+            stopping.set()
+            # shutdown() waits for serve_forever, which runs on this (the main) thread
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # the parent turns Ctrl-C into SIGTERM
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, (signal.SIGTERM, signal.SIGINT))
+    budget.on_spent = stop
+    catalogue.start_watcher(watch_interval)         # threads do not survive fork
+    code = 0
+    try:
+        server.serve_forever()
+        # server_close joins the request threads: accepted connections are answered
+        closer = threading.Thread(target=server.server_close, daemon=True)
+        closer.start()
+        closer.join(graceful)
+    except Exception:
+        code = 1
+    finally:
+        crypto_log.shutdown()
+        sys.stderr.flush()
+    os._exit(code)
+
+
+def main(argv: Optional[list] = None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    ap.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 2))))
+    ap.add_argument("--max-requests", type=int, default=int(os.getenv("WEB_MAX_REQUESTS", "10000")),
+                    help="recycle a worker after this many requests (0 = never)")
+    ap.add_argument("--max-requests-jitter", type=int, default=int(os.getenv("WEB_MAX_REQUESTS_JITTER", "500")))
+    ap.add_argument("--graceful-timeout", type=float, default=float(os.getenv("WEB_GRACEFUL_TIMEOUT", "30")),
+                    help="seconds a stopping worker waits for in-flight requests")
+    args = ap.parse_args(argv)
+
+    # everything below is decided before the app is imported (these are read at import time)
+    os.environ["STARTUP_MODE"] = "eager"
+    os.environ.setdefault("SESSION_STORE", "sqlite")   # shared by workers and kept across recycling
+    watch_interval = float(os.getenv("CATALOGUE_WATCH_INTERVAL", "2"))
+    os.environ["CATALOGUE_WATCH_INTERVAL"] = "0"   # no threads in the parent; workers start their own
+
+    started = time.perf_counter()
+    import app as web
+    from werkzeug.serving import make_server
+    from utils import crypto_log, startup
+    warmed = warm_caches(chip_queries())
+    budget = _Budget(web.app, 0, None)
+    server = make_server(args.host, args.port, budget, threaded=True)
+    server.daemon_threads = False   # track request threads so a stopping worker can wait for them
+    # werkzeug sets its logger up lazily and racily; concurrent first requests in a
+    # fresh worker would lose their access-log lines
+    access_log = logging.getLogger("werkzeug")
+    if access_log.level == logging.NOTSET:
+        access_log.setLevel(logging.INFO)
+    if not access_log.handlers:
+        access_log.addHandler(logging.StreamHandler())
+    crypto_log.shutdown()   # nothing queued yet, but no writer thread may cross the fork
+    gc.collect()
+    gc.freeze()             # keep the GC from touching (and copying) the shared heap in workers
+    print(f"serving http://{args.host}:{server.port} with {args.workers} workers "
+          f"(ready in {time.perf_counter() - started:.2f}s, {warmed} warm-up queries, "
+          f"startup {startup.report()['phases_ms']})", file=sys.stderr)
+
+    children: Dict[int, int] = {}   # pid -> slot
+    stopping = False
+
+    def spawn(slot: int):
+        budget.limit = args.max_requests + (random.randint(0, args.max_requests_jitter)
+                                            if args.max_requests and args.max_requests_jitter else 0)
+        # the child must not run the parent's handlers before installing its own
+        signal.pthread_sigmask(signal.SIG_BLOCK, (signal.SIGTERM, signal.SIGINT))
+        pid = os.fork()
+        if pid == 0:
+            _worker(server, budget, watch_interval, args.graceful_timeout)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, (signal.SIGTERM, signal.SIGINT))
+        children[pid] = slot
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(max(1, args.workers)):
+        spawn(slot)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            if os.waitstatus_to_exitcode(status) != 0:
+                time.sleep(1)   # a crashing worker should not spin
+            spawn(slot)
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
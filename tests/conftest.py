@@ -0,0 +1,21 @@
+﻿import os, sys
+from collections import Counter
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import llm as llm_module
+from utils.cache import TTLCache
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """utils.llm with an API key set, empty caches and counters, and no pooled session."""
+    monkeypatch.setattr(llm_module, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(llm_module, "CACHE", TTLCache(maxsize=64, ttl=60))
+    monkeypatch.setattr(llm_module, "DISK_CACHE", None)
+    monkeypatch.setattr(llm_module, "STATS", Counter())
+    monkeypatch.setattr(llm_module, "_session", None)
+    yield llm_module
+    if llm_module._session is not None:
+        llm_module._session.close()
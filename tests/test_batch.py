@@ -0,0 +1,31 @@
+﻿import json
+from batch import read_items, run_batch
+
+
+def test_read_items_accepts_objects_and_strings():
+    lines = ['{"id": "a", "message": "Help"}', "", '"hi"', '{"request_id": 9, "text": "Ella"}']
+    assert list(read_items(lines)) == [{"id": "a", "message": "Help"}, {"id": 3, "message": "hi"},
+                                       {"id": 9, "error": 'line 4: "message" must be a string'}]
+    assert list(read_items(lines[3:], field="text")) == [{"id": 9, "message": "Ella"}]
+
+
+def test_bad_lines_become_per_item_errors():
+    items = list(read_items(["{not json", "[1, 2]", "null", '{"id": 5, "message": 3}', '"Help"']))
+    assert [i.get("error", "").split(":")[0] for i in items] == ["line 1", "line 2", "line 3", "line 4", ""]
+    results = list(run_batch(items))
+    assert [r["id"] for r in results] == [1, 2, 3, 5, 5]
+    assert all("error" in r and "intent" not in r for r in results[:4])
+    assert results[4]["intent"] == "help"
+
+
+def test_batch_endpoint_reports_bad_lines():
+    from app import app
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user"] = "admin"
+    body = '"Tell me about Sigiriya"\n{oops\n[]\n'
+    res = client.post("/chat/batch", data=body)
+    assert res.status_code == 200
+    out = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+    assert out[0]["intent"] == "facts"
+    assert [o["id"] for o in out[1:]] == [2, 3] and all("error" in o for o in out[1:])
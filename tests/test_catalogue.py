@@ -0,0 +1,43 @@
+﻿import threading, time
+from utils.catalogue import Catalogue
+
+
+def test_peek_never_builds_or_waits():
+    cat = Catalogue.from_dict({"Kandy": {}})
+    started, release = threading.Event(), threading.Event()
+
+    def slow(c):
+        started.set()
+        release.wait(5)
+        return "table"
+
+    builder = threading.Thread(target=cat.derived, args=("slow", slow))
+    builder.start()
+    started.wait(5)
+    t0 = time.perf_counter()
+    assert cat.peek("slow") is None
+    assert time.perf_counter() - t0 < 0.1
+    release.set()
+    builder.join()
+    assert cat.peek("slow") == "table"
+    assert cat.peek("missing") is None
+    assert "missing" not in cat._derived
+
+
+def test_peek_with_build_fills_in_the_background():
+    cat = Catalogue.from_dict({"Kandy": {}})
+    calls = []
+
+    def build(c):
+        calls.append(1)
+        time.sleep(0.05)
+        return len(c)
+
+    assert cat.peek("n", build) is None
+    assert cat.peek("n", build) is None   # already building: no second build
+    for _ in range(100):
+        if cat.peek("n") is not None:
+            break
+        time.sleep(0.01)
+    assert cat.peek("n") == 1
+    assert calls == [1]
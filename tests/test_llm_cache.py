@@ -0,0 +1,110 @@
+﻿import time
+import pytest
+from utils.cache import DiskCache, TTLCache
+
+
+@pytest.fixture
+def rewrites(llm, monkeypatch):
+    """Replace the upstream call with a stub; returns the list of texts it was asked to rewrite."""
+    calls = []
+
+    def rewrite(text, max_len):
+        calls.append(text)
+        return f"polished: {text}"[:max_len]
+
+    monkeypatch.setattr(llm, "_llm_rewrite", rewrite)
+    return calls
+
+
+def test_repeat_is_served_from_cache(llm, rewrites):
+    assert llm.polish_text("Sigiriya is a rock fortress.") == "polished: Sigiriya is a rock fortress."
+    assert llm.polish_text("Sigiriya is a rock fortress.") == "polished: Sigiriya is a rock fortress."
+    assert rewrites == ["Sigiriya is a rock fortress."]
+    assert llm.cache_stats()["memory"]["hits"] == 1
+
+
+def test_key_covers_text_and_max_len(llm, rewrites):
+    llm.polish_text("Kandy", 600)
+    llm.polish_text("Kandy", 12)
+    llm.polish_text("Galle", 600)
+    assert len(rewrites) == 3
+    assert llm.polish_text("Kandy", 12) == "polished: Ka"
+    assert len(rewrites) == 3
+
+
+def test_key_covers_model_and_prompt_version(llm, rewrites, monkeypatch):
+    llm.polish_text("Ella")
+    monkeypatch.setattr(llm, "PROMPT_VERSION", llm.PROMPT_VERSION + "-next")
+    llm.polish_text("Ella")
+    monkeypatch.setattr(llm, "LLM_MODEL", "other-model")
+    llm.polish_text("Ella")
+    assert len(rewrites) == 3
+
+
+def test_failures_fall_back_and_are_not_cached(llm, monkeypatch):
+    outcomes = [RuntimeError("upstream 500"), "polished"]
+
+    def rewrite(text, max_len):
+        out = outcomes.pop(0)
+        if isinstance(out, Exception):
+            raise out
+        return out
+
+    monkeypatch.setattr(llm, "_llm_rewrite", rewrite)
+    assert llm.polish_text("Kandy has a lake.") == llm._fallback("Kandy has a lake.", 600)
+    assert llm.STATS["fallback_error"] == 1
+    assert llm.polish_text("Kandy has a lake.") == "polished"
+    assert llm.polish_text("Kandy has a lake.") == "polished"
+    assert outcomes == []
+
+
+def test_busy_falls_back_without_caching(llm, monkeypatch):
+    def busy(text, max_len):
+        raise llm.LLMBusy()
+
+    monkeypatch.setattr(llm, "_llm_rewrite", busy)
+    assert llm.polish_text("Galle Fort.") == llm._fallback("Galle Fort.", 600)
+    assert llm.STATS["fallback_busy"] == 1
+    assert len(llm.CACHE) == 0
+
+
+def test_without_api_key_uses_local_formatter(llm, rewrites, monkeypatch):
+    monkeypatch.setattr(llm, "OPENAI_API_KEY", None)
+    assert llm.polish_text("Nuwara Eliya. Tea country.") == llm._fallback("Nuwara Eliya. Tea country.", 600)
+    assert rewrites == []
+
+
+def test_disk_tier_survives_memory_and_refills_it(llm, rewrites, monkeypatch, tmp_path):
+    monkeypatch.setattr(llm, "DISK_CACHE", DiskCache(str(tmp_path / "llm.sqlite3"), ttl=60))
+    llm.polish_text("Adam's Peak")
+    llm.CACHE.clear()   # as after a restart
+    assert llm.polish_text("Adam's Peak") == "polished: Adam's Peak"
+    assert rewrites == ["Adam's Peak"]
+    assert llm.DISK_CACHE.stats()["hits"] == 1
+    llm.polish_text("Adam's Peak")
+    assert llm.DISK_CACHE.stats()["hits"] == 1   # promoted to memory
+
+
+def test_stream_uses_and_fills_the_cache(llm, rewrites):
+    llm.polish_text("Dambulla caves.")
+    assert list(llm.polish_stream("Dambulla caves.")) == ["polished: Dambulla caves."]
+    assert rewrites == ["Dambulla caves."]
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=2, ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats() == {"size": 0, "hits": 1, "misses": 1}
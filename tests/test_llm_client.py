@@ -0,0 +1,152 @@
+﻿import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+
+class FakeLLM(BaseHTTPRequestHandler):
+    """OpenAI-style /chat/completions on 127.0.0.1; the server's `mode` picks the behaviour."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        srv = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        text = body["messages"][-1]["content"].split("Text to rewrite:\n", 1)[-1]
+        with srv.lock:
+            srv.ports.add(self.client_address[1])
+            srv.active += 1
+            srv.peak = max(srv.peak, srv.active)
+        try:
+            time.sleep(srv.delay)
+            if srv.mode == "error":
+                self._send(500, b"{}")
+            elif srv.mode == "trickle":
+                self.send_response(200)
+                self.send_header("Content-Length", "100000")
+                self.end_headers()
+                for _ in range(50):
+                    self.wfile.write(b" ")
+                    self.wfile.flush()
+                    time.sleep(0.05)
+            elif body.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for word in text.split(" "):
+                    chunk = {"choices": [{"delta": {"content": word + " "}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    if srv.mode == "trickle-stream":
+                        time.sleep(0.1)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+            else:
+                self._send(200, json.dumps({"choices": [{"message": {"content": "LLM: " + text}}]}).encode())
+        except OSError:
+            pass   # the client gave up
+        finally:
+            with srv.lock:
+                srv.active -= 1
+
+    def _send(self, status, data):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def server(llm, monkeypatch):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), FakeLLM)
+    srv.daemon_threads = True
+    srv.mode, srv.delay = "echo", 0.0
+    srv.lock, srv.ports, srv.active, srv.peak = threading.Lock(), set(), 0, 0
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    monkeypatch.setattr(llm, "OPENAI_BASE_URL", f"http://127.0.0.1:{srv.server_port}")
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_rewrite_reuses_one_pooled_connection(llm, server):
+    for place in ("Kandy", "Galle", "Ella"):
+        assert llm.polish_text(place) == "LLM: " + place
+    assert len(server.ports) == 1
+    assert llm.STATS["llm_calls"] == 3
+
+
+def test_stream_yields_growing_text_then_caches_it(llm, server):
+    parts = list(llm.polish_stream("Temple of the Tooth"))
+    assert parts[0] == "Temple "
+    assert parts[-1] == "Temple of the Tooth"
+    assert llm.polish_text("Temple of the Tooth") == "Temple of the Tooth"
+    assert llm.STATS["llm_calls"] == 1
+
+
+def test_http_error_falls_back(llm, server):
+    server.mode = "error"
+    assert llm.polish_text("Galle Fort.") == llm._fallback("Galle Fort.", 600)
+    assert llm.STATS["fallback_error"] == 1
+    assert len(llm.CACHE) == 0
+
+
+def test_slow_upstream_times_out(llm, server, monkeypatch):
+    monkeypatch.setattr(llm, "LLM_TIMEOUT", 0.2)
+    server.delay = 1.0
+    started = time.monotonic()
+    assert llm.polish_text("Sigiriya.") == llm._fallback("Sigiriya.", 600)
+    assert time.monotonic() - started < 0.8
+    assert llm.STATS["fallback_timeout"] == 1
+
+
+@pytest.mark.parametrize("mode", ["trickle", "trickle-stream"])
+def test_trickling_upstream_hits_the_total_deadline(llm, server, monkeypatch, mode):
+    # every read succeeds well within LLM_TIMEOUT, but the reply as a whole does not
+    monkeypatch.setattr(llm, "LLM_TIMEOUT", 0.3)
+    server.mode = mode
+    text = "one two three four five six seven eight nine ten"
+    started = time.monotonic()
+    if mode == "trickle":
+        out = llm.polish_text(text)
+    else:
+        out = list(llm.polish_stream(text))[-1]
+    assert time.monotonic() - started < 0.8
+    assert out == llm._fallback(text, 600)
+    assert llm.STATS["fallback_timeout"] == 1
+
+
+def _polish_concurrently(llm, n):
+    results = [None] * n
+    def run(i):
+        results[i] = llm.polish_text(f"Place {i}.")
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrency_limit_sheds_load_to_the_fallback(llm, server, monkeypatch):
+    monkeypatch.setattr(llm, "_slots", threading.BoundedSemaphore(2))
+    monkeypatch.setattr(llm, "LLM_QUEUE_WAIT", 0)
+    server.delay = 0.3
+    results = _polish_concurrently(llm, 5)
+    assert server.peak <= 2
+    assert sum(r.startswith("LLM: ") for r in results) == llm.STATS["llm_calls"] <= 2
+    assert llm.STATS["fallback_busy"] == 5 - llm.STATS["llm_calls"]
+
+
+def test_queue_wait_lets_callers_take_turns(llm, server, monkeypatch):
+    monkeypatch.setattr(llm, "_slots", threading.BoundedSemaphore(2))
+    monkeypatch.setattr(llm, "LLM_QUEUE_WAIT", 5)
+    server.delay = 0.1
+    results = _polish_concurrently(llm, 5)
+    assert server.peak <= 2
+    assert results == [f"LLM: Place {i}." for i in range(5)]
+    assert llm.STATS["fallback_busy"] == 0
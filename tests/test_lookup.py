@@ -0,0 +1,35 @@
+﻿from utils.catalogue import Catalogue
+from agents.ir_agent import PlaceIndex
+from agents.itinerary_agent import CityIndex
+
+CAT = Catalogue.from_dict({
+    "Sigiriya": {"aliases": ["Lion Rock", "!!"]},
+    "Kandy": {"aliases": ["Temple of the Tooth"]},
+    "Kandy Lake": {},
+    "Galle": {"aliases": ["Galle Fort"]},
+})
+
+
+def test_place_lookup_prefers_catalogue_order():
+    index = PlaceIndex(CAT)
+    assert index.best_match("lion rock") == "Sigiriya"
+    assert index.best_match("Kandy") == "Kandy"
+    assert index.best_match("kandy lake") == "Kandy"          # "kandy" is contained, and ranks first
+    assert index.best_match("the tooth") == "Kandy"
+    assert index.best_match("Gall") == "Galle"
+    assert index.best_match("Sigirya") == "Sigiriya"          # fuzzy
+
+
+def test_empty_queries_and_keys_match_nothing():
+    index = PlaceIndex(CAT)
+    assert index.best_match("") is None
+    assert index.best_match("?!") is None                      # normalizes to ""; used to return the first place
+    assert index.best_match("Galle Fort") == "Galle"           # the "!!" alias no longer matches everything
+
+
+def test_city_resolution():
+    index = CityIndex(Catalogue.from_dict({"": {}, "Kandy": {}, "Galle": {}}))
+    assert index.resolve("a day in galle") == "Galle"
+    assert index.resolve("kan") == "Kandy"
+    assert index.resolve("") is None
+    assert index.resolve("Jaffna") is None
@@ -0,0 +1,124 @@
+﻿import random
+from itertools import combinations
+import pytest
+from agents import itinerary_agent as it
+from utils import catalogue
+from utils.catalogue import Catalogue
+
+
+def brute_force(stops, minutes):
+    """Best total priority x minutes over every subset of stops that fits."""
+    best = 0.0
+    for k in range(len(stops) + 1):
+        for subset in combinations(stops, k):
+            if sum(d for _, d, _ in subset) <= minutes:
+                best = max(best, sum(p * d for _, d, p in subset))
+    return best
+
+
+def stop_set(rnd, equal_priority):
+    n = rnd.randint(0, 8)
+    return [(f"s{i}", rnd.choice([0, 10, 15, 20, 25, 30, 45, 60, 90, 120]),
+             1.0 if equal_priority else float(rnd.randint(1, 5))) for i in range(n)]
+
+
+@pytest.mark.parametrize("equal_priority", [True, False], ids=["subset-sum", "weighted"])
+def test_optimal_matches_brute_force(equal_priority):
+    rnd = random.Random(5 if equal_priority else 6)
+    for _ in range(1500):
+        stops = stop_set(rnd, equal_priority)
+        minutes = rnd.randint(0, 300)
+        chosen, used = it._solve_optimal(stops, minutes)
+        pri = {name: p for name, _, p in stops}
+        assert used == sum(s["minutes"] for s in chosen) <= minutes
+        assert sum(pri[s["name"]] * s["minutes"] for s in chosen) == pytest.approx(brute_force(stops, minutes))
+        names = [s["name"] for s in chosen]
+        assert names == sorted(names, key=lambda s: int(s[1:]))   # dataset order
+
+
+def _catalogue(stops, coords=False, seed=0):
+    rnd = random.Random(seed)
+    entry = {"stops": [{"name": n, "minutes": d, "priority": p,
+                        **({"lat": 7 + rnd.random() * 0.05, "lon": 80 + rnd.random() * 0.05} if coords else {})}
+                       for n, d, p in stops]}
+    return Catalogue.from_dict({"Town": entry})
+
+
+@pytest.fixture
+def live(monkeypatch):
+    """Install a catalogue as the live one for plan(), which then solves each call
+    itself (no PlanTable is built in the background)."""
+    monkeypatch.setattr(Catalogue, "peek", lambda self, key, build=None: self._derived.get(key))
+
+    def install(cat):
+        monkeypatch.setattr(catalogue, "_current", cat)
+        return cat
+    return install
+
+
+def test_too_many_cells_falls_back_to_greedy(live, monkeypatch):
+    stops = [("a", 40, 1.0), ("b", 50, 3.0), ("c", 60, 2.0), ("d", 35, 5.0)]
+    live(_catalogue(stops))
+    assert it.plan("Town", 120, "optimal")["strategy"] == "optimal"
+    monkeypatch.setattr(it, "PLAN_MAX_CELLS", 10)
+    assert it._solve_optimal(stops, 120) is None
+    res = it._expand(catalogue._current, "Town", 120, it._solve_place(catalogue._current, "Town", 120, "optimal"))
+    greedy, used = it._pack_stops([(n, d) for n, d, _ in stops], 120)
+    assert res["strategy"] == "greedy"
+    assert (res["stops"], res["planned_minutes"]) == (greedy, used)
+
+
+def test_nothing_fits_gives_the_first_stop_clipped(live):
+    live(_catalogue([("Long walk", 200, 1.0), ("Museum", 150, 2.0)]))
+    for strategy in ("optimal", "greedy"):
+        res = it.plan("Town", 90, strategy)
+        assert res["stops"] == [{"name": "Long walk", "minutes": 90}]
+        assert res["planned_minutes"] == 90 and res["total_minutes"] == 90
+    live(_catalogue([("Long walk", 200, 1.0), ("Museum", 150, 2.0)], coords=True))
+    res = it.plan("Town", 90, "route")
+    assert (res["strategy"], res["stops"]) == ("route", [{"name": "Long walk", "minutes": 90}])
+    assert (res["planned_minutes"], res["travel_minutes"]) == (90, 0)
+
+
+def test_table_and_single_solve_agree(live):
+    rnd = random.Random(8)
+    for seed in range(40):
+        cat = live(_catalogue(stop_set(rnd, seed % 2 == 0), coords=seed % 3 == 0, seed=seed))
+        table = it.PlanTable(cat)
+        for minutes in (45, 60, 100, 180, 300):
+            for strategy in it.STRATEGIES:
+                direct = it.plan("Town", minutes, strategy)
+                assert direct == table.get(cat, "Town", max(it.MIN_MINUTES, minutes), strategy)
+
+
+def test_route_plans_count_travel_and_fit_the_budget(live):
+    rnd = random.Random(9)
+    for seed in range(60):
+        stops = [(f"s{i}", rnd.choice([15, 20, 30, 45, 60]), float(rnd.randint(1, 4))) for i in range(rnd.randint(2, 8))]
+        live(_catalogue(stops, coords=True, seed=seed))
+        for minutes in (45, 60, 90, 120, 180, 240, 360):
+            res = it.plan("Town", minutes, "route")
+            assert res["strategy"] == "route"
+            travel = sum(s.get("travel_minutes", 0) for s in res["stops"])
+            assert res["travel_minutes"] == travel
+            assert res["planned_minutes"] == sum(s["minutes"] for s in res["stops"]) + travel
+            assert res["planned_minutes"] <= minutes
+
+
+@pytest.mark.parametrize("strategy", ["route", "optimal", "greedy"])
+def test_budgets_past_saturation_plan_like_the_capped_key(live, strategy):
+    # PlanTable._key collapses every budget >= _saturation onto one entry
+    rnd = random.Random(10)
+    for seed in range(40):
+        stops = [(f"s{i}", rnd.choice([15, 20, 30, 45, 60, 90]), float(rnd.randint(1, 4))) for i in range(rnd.randint(1, 7))]
+        cat = live(_catalogue(stops, coords=True, seed=seed))
+        travel = cat.derived("itinerary.travel", it.TravelIndex).get("Town")
+        cap = it._saturation(cat["Town"], travel if it._resolve(strategy, travel) == "route" else None)
+        at_cap = it._solve_place(cat, "Town", cap, strategy)
+        for extra in (1, 7, 60, cap):
+            assert it._solve_place(cat, "Town", cap + extra, strategy) == at_cap
+        table = it.PlanTable(cat)
+        assert table._key("Town", cap + 100, it._resolve(strategy, travel))[1] == cap
+        res = table.get(cat, "Town", cap + 100, strategy)
+        assert res["total_minutes"] == cap + 100
+        assert res["stops"] == it._expand(cat, "Town", cap, at_cap)["stops"]
@@ -0,0 +1,55 @@
+﻿import pytest
+from agents.dialogue_agent import _route, parse_minutes, route_cache_info, route_intent
+from benchmarks.bench_routing import corpus, legacy_route
+
+
+@pytest.mark.parametrize("message, intent, payload", [
+    ("Tell me about Sigiriya", "facts", {"place": "sigiriya"}),
+    ("Tell me about Galle?", "facts", {"place": "galle"}),
+    ("Ticket price in Kandy", "facts", {"place": "Ticket price in Kandy"}),
+    ("Plan 90 minutes around Nuwara Eliya", "itinerary", {"city": "Nuwara Eliya", "minutes": 90}),
+    ("Plan a 2h tour in Galle", "itinerary", {"city": "Galle", "minutes": 120}),
+    ("plan about kandy", "itinerary", {"city": "Plan About Kandy", "minutes": None}),   # plan beats facts
+    ("Help me plan a tour", "help", {}),                                                 # help beats everything
+    ("hi", "chitchat", {}),
+    ("chip", "chitchat", {}),      # triggers match as substrings ("hi"), as they always have
+    ("Ella", "facts", {"place": "Ella"}),
+    ("Kandy ticket", "facts", {"place": "Kandy ticket"}),
+    ("the weather would be lovely today", "unknown", {}),
+    ("", "unknown", {}),
+    (None, "unknown", {}),
+])
+def test_route_intent(message, intent, payload):
+    got_intent, got_payload = route_intent(message)
+    assert (got_intent, dict(got_payload)) == (intent, payload)
+
+
+def test_matches_legacy_router_on_random_corpus():
+    mismatches = []
+    for m in corpus(3000):
+        intent, payload = _route.__wrapped__(m)   # unmemoized
+        if (intent, dict(payload)) != legacy_route(m):
+            mismatches.append(m)
+    assert mismatches == []
+
+
+def test_memoized_payload_is_read_only():
+    _, payload = route_intent("Plan 2 hours in Kandy")
+    with pytest.raises(TypeError):
+        payload["city"] = "Galle"
+    assert route_intent("Plan 2 hours in Kandy")[1]["city"] == "Kandy"
+
+
+def test_repeat_messages_hit_the_memo():
+    before = route_cache_info()["hits"]
+    route_intent("Tell me about Ella")
+    route_intent("Tell me about Ella")
+    assert route_cache_info()["hits"] >= before + 1
+
+
+@pytest.mark.parametrize("text, minutes", [
+    ("2h", 120), ("2 hr", 120), ("1.5 hours", 90), ("120m", 120), ("45 minutes", 45),
+    ("0.2 hours", 30), ("5 mins", 15), ("no time given", None), ("", None), (None, None),
+])
+def test_parse_minutes(text, minutes):
+    assert parse_minutes(text) == minutes
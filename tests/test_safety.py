@@ -0,0 +1,60 @@
+﻿import random
+import pytest
+from better_profanity import profanity
+from agents.safety_agent import BANNED_SUBSTRINGS, MATCHER, check_input
+from benchmarks.bench_safety import MESSAGES, legacy_check
+
+# the compiled matcher re-implements better_profanity's matching rules; these
+# tests compare it with the library itself, so a library upgrade that changes
+# them fails here instead of silently letting messages through
+
+
+def corpus(n: int, seed: int = 11):
+    words = sorted(str(w) for w in profanity.CENSOR_WORDSET)
+    subs = {k: sorted(v) for k, v in profanity.CHARS_MAPPING.items()}
+    plain = "tell me about sigiriya plan a tour in kandy ticket price the temple class assess grape".split()
+    seps = [" ", "  ", "-", "_", ".", "*", "!", ", ", "", "'", "\n", "$"]
+    rnd = random.Random(seed)
+
+    def mangle(word):
+        out = []
+        for ch in word:
+            if ch in subs and rnd.random() < 0.3:
+                ch = rnd.choice(subs[ch])
+            out.append(ch.upper() if rnd.random() < 0.2 else ch)
+        return "".join(out)
+
+    def piece():
+        r = rnd.random()
+        if r < 0.25:
+            return mangle(rnd.choice(words))
+        if r < 0.35:   # a multi-word entry split or joined differently
+            w = rnd.choice([w for w in words if " " in w] or words)
+            return w.replace(" ", rnd.choice(seps))
+        if r < 0.45:
+            return rnd.choice(sorted(BANNED_SUBSTRINGS))
+        if r < 0.5:   # fragments glued to other words
+            return rnd.choice(plain) + mangle(rnd.choice(words))[:rnd.randint(1, 6)]
+        return rnd.choice(plain)
+
+    out = []
+    for _ in range(n):
+        parts = [piece() for _ in range(rnd.randint(0, 6))]
+        text = "".join(p + rnd.choice(seps) for p in parts)
+        out.append(text if rnd.random() < 0.5 else text.rstrip())
+    return out
+
+
+@pytest.mark.parametrize("message", MESSAGES + ["", " ", "a", "sh1t", "s h i t", "<3 kandy", "<b>hi</b>"])
+def test_check_input_matches_legacy(message):
+    assert check_input(message) == legacy_check(message)
+
+
+def test_profanity_matches_library_on_fuzzed_corpus():
+    mismatches = [m for m in corpus(10000) if MATCHER.profane(m) != profanity.contains_profanity(m)]
+    assert mismatches == []
+
+
+def test_reason_codes_match_legacy_on_fuzzed_corpus():
+    mismatches = [m for m in corpus(3000, seed=12) if check_input(m) != legacy_check(m)]
+    assert mismatches == []
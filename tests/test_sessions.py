@@ -0,0 +1,59 @@
+﻿import time
+import pytest
+from flask import Flask, session
+from utils import sessions
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def client(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "TOUCH_SLACK", 0.0)
+    app = Flask(__name__)
+    app.session_interface = sessions.ServerSessionInterface(
+        sessions.make_store(request.param, str(tmp_path / "sessions.sqlite3"), ttl=0.5))
+
+    @app.get("/set/<value>")
+    def set_value(value):
+        session["value"] = value
+        return "ok"
+
+    @app.get("/get")
+    def get_value():
+        return session.get("value", "-")
+
+    return app.test_client()
+
+
+def test_unchanged_session_is_not_rewritten_but_kept(client):
+    assert client.get("/set/a").status_code == 200
+    res = client.get("/get")
+    assert res.get_data(as_text=True) == "a"
+    assert "Set-Cookie" not in res.headers
+
+
+def test_reads_keep_an_active_session_alive(client):
+    client.get("/set/a")
+    for _ in range(4):   # 1.2 s in total, well past the 0.5 s TTL since the write
+        time.sleep(0.3)
+        assert client.get("/get").get_data(as_text=True) == "a"
+
+
+def test_idle_session_expires(client):
+    client.get("/set/a")
+    time.sleep(0.7)
+    assert client.get("/get").get_data(as_text=True) == "-"
+
+
+def test_sqlite_store_reuses_connections_across_threads(tmp_path):
+    import threading
+    from utils.cache import DiskCache
+    store = DiskCache(str(tmp_path / "s.sqlite3"), ttl=60)
+    store.set("sid", {"user": "admin"})
+    opened = []
+    connect = store._connect
+    store._connect = lambda: opened.append(1) or connect()
+    for _ in range(20):   # one thread per request, as under the threaded server
+        t = threading.Thread(target=store.get, args=("sid",))
+        t.start()
+        t.join()
+    assert opened == []
+    assert store.get("sid") == {"user": "admin"}
@@ -0,0 +1,202 @@
+﻿"""Query the audit log without decrypting all of it.
+
+    python -m utils.audit_reader logs/audit.log --since 2025-09-01 --agent dialogue --intent facts
+
+A SQLite sidecar (`<log>.idx`) maps every line's byte offset to its timestamp,
+agent and intent. It is updated incrementally from where it stopped (and
+rebuilt if the log was rotated or truncated, or FERNET_KEY changed, since
+lines the old key could not decrypt were indexed without fields). Queries only read and decrypt
+the matching lines, fan decryption out to a process pool for large ranges, and
+stream JSON lines to stdout.
+"""
+import argparse, datetime, hashlib, json, mmap, os, sqlite3, sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+from cryptography.fernet import InvalidToken
+from utils.crypto_log import FERNET_KEY, fernet
+
+CHUNK = 2000          # lines per decode task
+PARALLEL_MIN = 4000   # below this many lines, decrypt in-process
+BATCH = 50_000        # lines indexed per transaction
+KEY_ID = hashlib.sha256(FERNET_KEY.encode()).hexdigest()[:16] if FERNET_KEY else "none"
+
+
+def decode_line(raw: bytes) -> Optional[dict]:
+    """Decode one log line (plain JSON or a Fernet token); None if unreadable."""
+    raw = raw.strip()
+    if not raw:
+        return None
+    try:
+        if raw.startswith(b"{"):
+            return json.loads(raw)
+        if fernet is None:
+            return None
+        return json.loads(fernet.decrypt(raw))
+    except (InvalidToken, ValueError):
+        return None
+
+
+def _decode_chunk(lines: List[bytes]) -> List[Optional[dict]]:
+    return [decode_line(line) for line in lines]
+
+
+def _decode_all(lines: Iterable[bytes], pool: Optional[ProcessPoolExecutor]) -> Iterator[Optional[dict]]:
+    it = iter(lines)
+    chunks = iter(lambda: list(islice(it, CHUNK)), [])
+    results = pool.map(_decode_chunk, chunks) if pool else map(_decode_chunk, chunks)
+    for chunk in results:
+        yield from chunk
+
+
+def _epoch(ts) -> Optional[float]:
+    if not ts:
+        return None
+    try:
+        dt = datetime.datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.timestamp()
+
+
+class AuditIndex:
+    """Sidecar index of (offset, length, ts, agent, intent) for one log file."""
+
+    def __init__(self, log_path: str, index_path: Optional[str] = None, workers: Optional[int] = None):
+        self.log_path = log_path
+        self.index_path = index_path or log_path + ".idx"
+        self.workers = workers
+        self.db = sqlite3.connect(self.index_path)
+        self.db.executescript(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE IF NOT EXISTS lines (offset INTEGER PRIMARY KEY, length INTEGER,"
+            " ts REAL, agent TEXT, intent TEXT);"
+            "CREATE INDEX IF NOT EXISTS lines_ts ON lines (ts);"
+            "CREATE INDEX IF NOT EXISTS lines_agent ON lines (agent, intent, ts);"
+        )
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _head(self) -> str:
+        with open(self.log_path, "rb") as f:
+            return hashlib.sha1(f.readline()).hexdigest()
+
+    def _pool(self) -> Optional[ProcessPoolExecutor]:
+        return None if self.workers == 0 else ProcessPoolExecutor(max_workers=self.workers)
+
+    def update(self) -> int:
+        """Index lines appended since the last update; returns how many were added."""
+        size = os.path.getsize(self.log_path)
+        done = int(self._meta("size") or 0)
+        head = self._head()
+        if size < done or (done and (self._meta("head") != head or self._meta("key") != KEY_ID)):
+            # rotated, truncated or a different key: start over
+            self.db.execute("DELETE FROM lines")
+            done = 0
+        if size == done:
+            return 0
+        added = 0
+        pool = self._pool()
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(done)
+                offset = done
+                while True:
+                    # bounded batches, so indexing a huge log never holds it all in memory
+                    spans: List[Tuple[int, int]] = []
+                    raws: List[bytes] = []
+                    for line in islice(f, BATCH):
+                        if not line.endswith(b"\n"):
+                            break  # partial write in progress; pick it up next time
+                        spans.append((offset, len(line)))
+                        raws.append(line)
+                        offset += len(line)
+                    if not raws:
+                        break
+                    rows = []
+                    for (off, length), event in zip(spans, _decode_all(raws, pool if len(raws) >= PARALLEL_MIN else None)):
+                        event = event or {}
+                        rows.append((off, length, _epoch(event.get("ts")), event.get("agent"),
+                                     event.get("intent") or event.get("event")))
+                    with self.db:
+                        self.db.executemany("INSERT OR REPLACE INTO lines VALUES (?, ?, ?, ?, ?)", rows)
+                        self.db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                            [("size", str(offset)), ("head", head), ("key", KEY_ID)])
+                    added += len(rows)
+                    if len(spans) < BATCH:
+                        break
+        finally:
+            if pool:
+                pool.shutdown()
+        return added
+
+    def find(self, since: Optional[float] = None, until: Optional[float] = None,
+             agent: Optional[str] = None, intent: Optional[str] = None) -> sqlite3.Cursor:
+        sql, args = "SELECT offset, length FROM lines WHERE 1=1", []
+        if since is not None:
+            sql += " AND ts >= ?"; args.append(since)
+        if until is not None:
+            sql += " AND ts < ?"; args.append(until)
+        if agent:
+            sql += " AND agent = ?"; args.append(agent)
+        if intent:
+            sql += " AND intent = ?"; args.append(intent)
+        return self.db.execute(sql + " ORDER BY offset", args)
+
+    def query(self, since: Optional[float] = None, until: Optional[float] = None,
+              agent: Optional[str] = None, intent: Optional[str] = None) -> Iterator[dict]:
+        """Stream decoded events matching the filters, in log order."""
+        self.update()
+        cur = self.find(since, until, agent, intent)
+        with open(self.log_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            pool = None
+            try:
+                while True:
+                    spans = cur.fetchmany(PARALLEL_MIN)
+                    if not spans:
+                        break
+                    if pool is None and len(spans) == PARALLEL_MIN:
+                        pool = self._pool()
+                    raws = (mm[off:off + length] for off, length in spans)
+                    for event in _decode_all(raws, pool):
+                        if event is not None:
+                            yield event
+            finally:
+                if pool:
+                    pool.shutdown()
+                mm.close()
+
+
+def _when(s: Optional[str]) -> Optional[float]:
+    return _epoch(s) if s else None
+
+
+def main(argv: Optional[list] = None):
+    ap = argparse.ArgumentParser(description="Filter and decrypt audit log events.")
+    ap.add_argument("log", nargs="?", default="logs/audit.log")
+    ap.add_argument("--since", help="ISO time, inclusive (UTC if no offset)")
+    ap.add_argument("--until", help="ISO time, exclusive")
+    ap.add_argument("--agent")
+    ap.add_argument("--intent", help="dialogue intent, or auth event (login/logout)")
+    ap.add_argument("--workers", type=int, default=None, help="decrypt processes (0 = in-process)")
+    ap.add_argument("--reindex", action="store_true", help="drop the sidecar index and rebuild it")
+    args = ap.parse_args(argv)
+
+    idx_path = args.log + ".idx"
+    if args.reindex and os.path.exists(idx_path):
+        os.remove(idx_path)
+    index = AuditIndex(args.log, idx_path, args.workers)
+    out = sys.stdout
+    for event in index.query(_when(args.since), _when(args.until), args.agent, args.intent):
+        out.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
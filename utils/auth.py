@@ -1,13 +1,20 @@
 ﻿import os
 from flask import session
 from werkzeug.security import generate_password_hash, check_password_hash
+from utils.startup import Lazy
 
 ADMIN_USER = os.getenv("ADMIN_USER", "admin")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
-ADMIN_HASH = generate_password_hash(ADMIN_PASSWORD)
+# hashing runs the password KDF (~0.2 s), so it happens on first use or in the warm-up
+_admin_hash = Lazy("auth.admin_hash", lambda: generate_password_hash(ADMIN_PASSWORD))
+
+def __getattr__(name):
+    if name == "ADMIN_HASH":
+        return _admin_hash.get()
+    raise AttributeError(name)
 
 def login(user: str, pwd: str) -> bool:
-    if user == ADMIN_USER and check_password_hash(ADMIN_HASH, pwd):
+    if user == ADMIN_USER and check_password_hash(_admin_hash.get(), pwd):
         session["user"] = user
         return True
     return False
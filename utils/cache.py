@@ -0,0 +1,156 @@
+﻿import json, os, queue, sqlite3, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    `ttl=None` disables expiry. `hits`/`misses` count `get` calls.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires is None or expires > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def touch(self, key: Hashable, slack: float = 0.0) -> bool:
+        """Restart a live entry's TTL (and mark it recently used); False if absent or expired."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (item[0] is not None and item[0] <= now):
+                return False
+            if self.ttl is not None:
+                self._data[key] = (now + self.ttl, item[1])
+            self._data.move_to_end(key)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class DiskCache:
+    """SQLite-backed key/value tier with TTL; values are stored as JSON.
+
+    Survives restarts and can be shared by several worker processes. Connections
+    are pooled per process rather than per thread: a threaded server runs each
+    request on a new thread, and opening a connection costs ~20x a lookup.
+    """
+
+    POOL_SIZE = 16   # idle connections kept per process
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(self.POOL_SIZE)
+        self._pid = os.getpid()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with self._conn() as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")   # WAL stays consistent; skips an fsync per write
+        return conn
+
+    @contextmanager
+    def _conn(self):
+        """Borrow a connection (one thread at a time) and return it to the pool."""
+        if self._pid != os.getpid():   # never reuse a connection across fork
+            self._pid, self._pool = os.getpid(), queue.LifoQueue(self.POOL_SIZE)
+        pool = self._pool
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._conn() as conn:
+            row = conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is not None and (row[1] is None or row[1] > time.time()):
+            self.hits += 1
+            return json.loads(row[0])
+        self.misses += 1
+        return default
+
+    def set(self, key: str, value: Any):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._conn() as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                         (key, json.dumps(value, ensure_ascii=False), expires))
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        value = self.get(key, default)
+        with self._conn() as conn, conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        return value
+
+    def touch(self, key: str, slack: float = 0.0) -> bool:
+        """Restart a live row's TTL. Skips the write unless it moves the expiry
+        by more than `slack` seconds; returns whether a row was updated."""
+        if self.ttl is None:
+            return False
+        now = time.time()
+        with self._conn() as conn, conn:
+            cur = conn.execute("UPDATE cache SET expires = ? WHERE key = ? AND expires > ? AND expires < ?",
+                               (now + self.ttl, key, now, now + self.ttl - slack))
+        return cur.rowcount > 0
+
+    def purge(self):
+        """Drop expired rows."""
+        with self._conn() as conn, conn:
+            conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
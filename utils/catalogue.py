@@ -0,0 +1,398 @@
+﻿import hashlib, json, mmap, os, pickle, struct, sys, threading, time
+from collections import Counter
+from array import array
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "places.json")
+SNAPSHOT_PATH = os.path.splitext(DATA_PATH)[0] + ".bin"
+
+_intern = sys.intern
+_NAN = float("nan")
+_KNOWN = {"city", "best_time", "ticket", "facts", "highlights", "aliases", "stops"}
+
+
+def _strs(values) -> Tuple[str, ...]:
+    return tuple(_intern(str(v)) for v in (values or ()))
+
+
+def _num(value, default, kind=float):
+    """`kind(value)`, or `default` when the field is missing or JSON null."""
+    return default if value is None else kind(value)
+
+
+class Place:
+    """One catalogue entry. Strings are interned; stops are stored as columns."""
+
+    __slots__ = ("name", "city", "best_time", "ticket", "facts", "highlights",
+                 "aliases", "stop_names", "stop_minutes", "stop_priority", "stop_lat", "stop_lon", "extra")
+
+    def __init__(self, name: str, data: dict):
+        self.name = _intern(name)
+        self.city = _intern(data.get("city") or "")
+        self.best_time = _intern(data.get("best_time") or "")
+        ticket = data.get("ticket")
+        self.ticket = _intern(ticket) if isinstance(ticket, str) else ticket
+        self.facts = _strs(data.get("facts"))
+        self.highlights = _strs(data.get("highlights"))
+        self.aliases = _strs(data.get("aliases"))
+        stops = data.get("stops") or []
+        self.stop_names = tuple(_intern(s.get("name") or "") for s in stops)
+        self.stop_minutes = array("i", (_num(s.get("minutes"), 30, int) for s in stops))
+        self.stop_priority = array("d", (_num(s.get("priority"), 1.0) for s in stops))
+        # optional coordinates; NaN where a stop has none
+        self.stop_lat = array("d", (_num(s.get("lat"), _NAN) for s in stops))
+        self.stop_lon = array("d", (_num(s.get("lon"), _NAN) for s in stops))
+        extra = {k: v for k, v in data.items() if k not in _KNOWN}
+        self.extra = extra or None
+
+    def stops(self) -> Iterator[Tuple[str, int]]:
+        return zip(self.stop_names, self.stop_minutes)
+
+
+class Catalogue:
+    """Read-only snapshot of the places dataset.
+
+    Indexes built from it (see `derived`) live on the snapshot, so they are
+    built once per load and shared by every agent in the process.
+    """
+
+    def __init__(self, places: Dict[str, Place]):
+        self.places = places
+        self._derived: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.RLock] = {}   # one per key: unrelated builds run concurrently
+        self._locks_lock = threading.Lock()
+        self._pending: set = set()   # keys `peek` is building in the background
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, dict]) -> "Catalogue":
+        return cls({name: Place(name, entry) for name, entry in data.items()})
+
+    def __getitem__(self, name: str) -> Place:
+        return self.places[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.places
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.places)
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    def get(self, name: str) -> Optional[Place]:
+        return self.places.get(name)
+
+    def items(self):
+        return self.places.items()
+
+    def derived(self, key: str, build: Callable[["Catalogue"], Any]) -> Any:
+        """Return the structure cached under `key`, building it on first use."""
+        value = self._derived.get(key)
+        if value is None:
+            with self._locks_lock:
+                lock = self._locks.get(key)
+                if lock is None:
+                    lock = self._locks[key] = threading.RLock()   # builders may use other derived indexes
+            with lock:
+                value = self._derived.get(key)
+                if value is None:
+                    value = build(self)
+                    self._derived[key] = value
+        return value
+
+    def peek(self, key: str, build: Optional[Callable[["Catalogue"], Any]] = None) -> Any:
+        """The structure cached under `key` if it is already built, else None:
+        never builds it or waits for a build in progress. With `build`, a
+        missing structure is also made available for later calls (built on a
+        daemon thread, once), for callers that can answer without it meanwhile."""
+        value = self._derived.get(key)
+        if value is None and build is not None:
+            with self._locks_lock:
+                start = key not in self._pending
+                self._pending.add(key)
+            if start:
+                threading.Thread(target=self._build_pending, args=(key, build),
+                                 name=f"build-{key}", daemon=True).start()
+        return value
+
+    def _build_pending(self, key: str, build: Callable[["Catalogue"], Any]):
+        try:
+            self.derived(key, build)
+        except Exception:
+            return   # stays pending: no retry per request; the next reload builds it again
+        with self._locks_lock:
+            self._pending.discard(key)
+
+
+# Index builders registered by the agents; the snapshot build step precomputes them.
+INDEX_BUILDERS: Dict[str, Callable[[Catalogue], Any]] = {}
+# key -> fingerprint of the code version and settings an index was built with
+INDEX_FINGERPRINTS: Dict[str, str] = {}
+
+def register_index(key: str, build: Callable[[Catalogue], Any], version: int = 1, config: tuple = ()):
+    """Register `build` under `key`. Bump `version` when the index's layout or
+    algorithm changes; `config` lists the settings its contents depend on.
+    Snapshotted indexes whose fingerprint differs are stale."""
+    INDEX_BUILDERS[key] = build
+    INDEX_FINGERPRINTS[key] = hashlib.sha256(json.dumps([key, version, list(config)]).encode()).hexdigest()[:16]
+
+
+# ---------- binary snapshot ----------
+# Layout: header | place records (compact JSON) | offset table (count+1 x u64)
+#         | names (JSON list) | pickled derived indexes | derived table (JSON)
+# The derived table maps key -> [offset, length, fingerprint]; the header holds
+# a digest over those fingerprints.
+SNAPSHOT_MAGIC = b"VTGSNAP\0"
+SNAPSHOT_VERSION = 2
+_HEADER = struct.Struct("<8sI32sqqIQQQQQ32s")
+
+
+def _file_sha256(path: str) -> bytes:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+def _fingerprint(prints: Dict[str, str]) -> bytes:
+    return hashlib.sha256(json.dumps(prints, sort_keys=True).encode()).digest()
+
+
+def _current_prints(stored: Dict[str, list]) -> Dict[str, str]:
+    """Fingerprints the running code expects for `stored`'s indexes (as stored if not registered yet)."""
+    return {key: INDEX_FINGERPRINTS.get(key, entry[2]) for key, entry in stored.items()}
+
+
+class MappedCatalogue(Catalogue):
+    """Catalogue backed by a memory-mapped snapshot.
+
+    Places are decoded on first access and indexes precomputed by the build
+    step are unpickled instead of rebuilt. Forked workers share the mapped pages.
+    """
+
+    def __init__(self, mm: mmap.mmap, count: int, table_off: int, names: List[str], stored: Dict[str, list]):
+        super().__init__({})   # decoded places
+        self._mm = mm
+        self._table = struct.Struct(f"<{count + 1}Q").unpack_from(mm, table_off)
+        self._names = names
+        self._pos = {name: i for i, name in enumerate(names)}
+        self._stored = stored
+
+    def __getitem__(self, name: str) -> Place:
+        place = self.places.get(name)
+        if place is None:
+            i = self._pos[name]
+            raw = self._mm[self._table[i]:self._table[i + 1]]
+            place = self.places[name] = Place(name, json.loads(raw))
+        return place
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._pos
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def get(self, name: str) -> Optional[Place]:
+        return self[name] if name in self._pos else None
+
+    def items(self):
+        return ((name, self[name]) for name in self._names)
+
+    def _fresh(self, key: str) -> Optional[list]:
+        entry = self._stored.get(key)
+        # registered after the snapshot was opened: check its fingerprint now
+        if entry is not None and entry[2] == INDEX_FINGERPRINTS.get(key, entry[2]):
+            return entry
+        return None
+
+    def derived(self, key: str, build: Callable[[Catalogue], Any]) -> Any:
+        def load_or_build(cat):
+            entry = self._fresh(key)
+            if entry is not None:
+                off, length, _ = entry
+                return pickle.loads(self._mm[off:off + length])
+            return build(cat)
+        return super().derived(key, load_or_build)
+
+    def peek(self, key: str, build: Optional[Callable[[Catalogue], Any]] = None) -> Any:
+        # asked to make it available: a stored index only needs unpickling, so load it now
+        if build is not None and key not in self._derived and self._fresh(key) is not None:
+            return self.derived(key, build)
+        return super().peek(key, build)
+
+
+def write_snapshot(data: Dict[str, dict], path: str = SNAPSHOT_PATH, source: str = DATA_PATH,
+                   builders: Optional[Dict[str, Callable[[Catalogue], Any]]] = None):
+    """Write `data` (plus indexes from `builders`) as a snapshot stamped with `source`."""
+    st = os.stat(source)
+    digest = _file_sha256(source)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"\0" * _HEADER.size)
+        offsets = []
+        for entry in data.values():
+            offsets.append(f.tell())
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        offsets.append(f.tell())
+        table_off = f.tell()
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        names_off = f.tell()
+        names = json.dumps(list(data), ensure_ascii=False).encode("utf-8")
+        f.write(names)
+        stored = {}
+        cat = Catalogue.from_dict(data)
+        for key, build in (builders or {}).items():
+            blob = pickle.dumps(build(cat), protocol=pickle.HIGHEST_PROTOCOL)
+            stored[key] = [f.tell(), len(blob), INDEX_FINGERPRINTS.get(key, "")]
+            f.write(blob)
+        derived_off = f.tell()
+        table = json.dumps(stored).encode("utf-8")
+        f.write(table)
+        f.seek(0)
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, digest, st.st_size, st.st_mtime_ns,
+                             len(data), table_off, names_off, len(names), derived_off, len(table),
+                             _fingerprint({key: entry[2] for key, entry in stored.items()})))
+    os.replace(tmp, path)
+
+
+def open_snapshot(path: str = SNAPSHOT_PATH, source: str = DATA_PATH) -> Optional[MappedCatalogue]:
+    """Map the snapshot at `path`, or return None if it is missing, invalid or
+    stale: built from another source file, or with indexes whose code version
+    or settings differ from the registered ones."""
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mm) < _HEADER.size:
+        return None
+    (magic, version, digest, size, mtime_ns, count, table_off,
+     names_off, names_len, derived_off, derived_len, fingerprint) = _HEADER.unpack_from(mm, 0)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        return None
+    if os.path.exists(source):
+        st = os.stat(source)
+        # cheap stamp check first; a touched-but-identical source still matches by hash
+        if (st.st_size, st.st_mtime_ns) != (size, mtime_ns) and _file_sha256(source) != digest:
+            return None
+    stored = json.loads(mm[derived_off:derived_off + derived_len])
+    if _fingerprint(_current_prints(stored)) != fingerprint:
+        return None
+    names = json.loads(mm[names_off:names_off + names_len])
+    return MappedCatalogue(mm, count, table_off, names, stored)
+
+
+def load(path: str = DATA_PATH) -> Catalogue:
+    """Load from the binary snapshot next to `path` when fresh, else from the JSON."""
+    snap = open_snapshot(os.path.splitext(path)[0] + ".bin", path)
+    if snap is not None:
+        return snap
+    with open(path, "r", encoding="utf-8-sig") as f:
+        return Catalogue.from_dict(json.load(f))
+
+
+_current: Optional[Catalogue] = None
+_stamp: Optional[Tuple[int, int]] = None   # (size, mtime_ns) of DATA_PATH behind _current
+_load_lock = threading.Lock()
+
+# reload metrics: counters plus details of the last attempt
+STATS: Counter = Counter()
+LAST_RELOAD: Dict[str, Any] = {}
+
+def _source_stamp(path: str = DATA_PATH) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+def loaded() -> Optional[Catalogue]:
+    """The live catalogue if one has been loaded, without loading it."""
+    return _current
+
+def get() -> Catalogue:
+    """Process-wide catalogue, loaded on first access.
+
+    Callers that make several lookups should call this once and keep the
+    result: `reload` may swap in a new catalogue at any time."""
+    global _current, _stamp
+    if _current is None:
+        with _load_lock:
+            if _current is None:
+                _stamp = _source_stamp()
+                _current = load()
+    return _current
+
+def reload() -> bool:
+    """Load the dataset again, build every registered index on the new
+    catalogue, then swap it in with one assignment. Requests that already
+    hold the old catalogue finish on it. On failure the current catalogue
+    stays; returns whether a new one was installed."""
+    global _current, _stamp
+    started = time.perf_counter()
+    stamp = _source_stamp()
+    try:
+        new = load()
+        for key, build in list(INDEX_BUILDERS.items()):
+            new.derived(key, build)
+    except Exception as e:
+        STATS["reload_failures"] += 1
+        LAST_RELOAD.clear()
+        LAST_RELOAD.update(ok=False, error=f"{type(e).__name__}: {e}", at=time.time(),
+                           seconds=time.perf_counter() - started)
+        return False
+    with _load_lock:
+        _current, _stamp = new, stamp
+    STATS["reloads"] += 1
+    LAST_RELOAD.clear()
+    LAST_RELOAD.update(ok=True, error=None, at=time.time(), places=len(new),
+                       seconds=time.perf_counter() - started)
+    return True
+
+def reload_stats() -> Dict[str, Any]:
+    return {**STATS, "last": dict(LAST_RELOAD)}
+
+
+# ---------- file watcher ----------
+WATCH_INTERVAL = float(os.getenv("CATALOGUE_WATCH_INTERVAL", "2"))   # seconds between polls (0 = off)
+_watcher: Optional[threading.Thread] = None
+
+def _watch(interval: float):
+    failed = seen = None
+    while True:
+        time.sleep(interval)
+        if _current is None:
+            continue   # not loaded yet; the first get() reads the current file anyway
+        stamp = _source_stamp()
+        if stamp is None or stamp == _stamp or stamp == failed:
+            seen = None
+            continue
+        if stamp != seen:
+            seen = stamp   # changed since the last poll: wait until it holds still
+            continue
+        if not reload():
+            failed = stamp   # retry once the file changes again
+        seen = None
+
+def start_watcher(interval: float = WATCH_INTERVAL) -> bool:
+    """Poll DATA_PATH's size/mtime in a daemon thread and `reload` after it
+    changes and then stays put for one interval. Does not load the
+    catalogue itself. Idempotent per process."""
+    global _watcher
+    if interval <= 0 or (_watcher is not None and _watcher.is_alive()):
+        return False
+    _watcher = threading.Thread(target=_watch, args=(interval,), name="catalogue-watcher", daemon=True)
+    _watcher.start()
+    return True
+
+def _sorted_names(cat: Catalogue) -> List[str]:
+    return sorted(cat)
+
+register_index("names.sorted", _sorted_names)
+
+def list_names(cat: Optional[Catalogue] = None) -> List[str]:
+    return (cat or get()).derived("names.sorted", _sorted_names)
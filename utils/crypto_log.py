@@ -1,17 +1,242 @@
-﻿import os, json, datetime
+﻿import os, json, datetime, atexit, fcntl, logging, queue, threading, time
+from collections import Counter
+from typing import Dict, List
 from cryptography.fernet import Fernet
 
+log = logging.getLogger(__name__)
+STATS = Counter()  # write_errors, dropped, reopened, rotations
+
 FERNET_KEY = os.getenv("FERNET_KEY")
 fernet = Fernet(FERNET_KEY.encode()) if FERNET_KEY else None
 
-def write_event(event: dict, path: str = "logs/audit.log"):
-    os.makedirs("logs", exist_ok=True)
-    event = {"ts": datetime.datetime.utcnow().isoformat()+"Z", **event}
-    line = json.dumps(event, ensure_ascii=False)
+AUDIT_ASYNC = os.getenv("AUDIT_ASYNC", "1") not in ("0", "false", "no")
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH = int(os.getenv("AUDIT_BATCH", "256"))                  # max events per write
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.2"))
+AUDIT_PUT_TIMEOUT = float(os.getenv("AUDIT_PUT_TIMEOUT", "0.05"))   # then write synchronously
+AUDIT_FSYNC = os.getenv("AUDIT_FSYNC", "batch")                     # "batch" or "never"
+AUDIT_MAX_BYTES = int(os.getenv("AUDIT_MAX_BYTES", "0"))            # rotate above this size (0 = off)
+AUDIT_ROTATE_SECONDS = float(os.getenv("AUDIT_ROTATE_SECONDS", "0"))  # rotate after this age (0 = off)
+
+def _encode(event: dict) -> bytes:
+    line = json.dumps(event, ensure_ascii=False, default=str)
     if fernet:
-        token = fernet.encrypt(line.encode("utf-8"))
-        with open(path, "ab") as f:
-            f.write(token + b"\n")
+        return fernet.encrypt(line.encode("utf-8")) + b"\n"
+    return (line + "\n").encode("utf-8")
+
+def _stamp(event: dict) -> dict:
+    return {"ts": datetime.datetime.utcnow().isoformat()+"Z", **event}
+
+def _append(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "ab") as f:
+        f.write(data)
+
+
+class AuditWriter:
+    """Background writer for one audit log file.
+
+    Events are queued by `submit` and a daemon thread encrypts and appends them
+    in batches: one write (and optionally one fsync) per batch, so encryption
+    and I/O stay off the request thread. A full queue makes `submit` wait
+    briefly and then write synchronously. A failed batch write is retried on a
+    fresh handle and then event by event; only events that still cannot be
+    written are dropped, and those are logged and counted in STATS.
+
+    The file is rotated by size and/or age. Several processes may write the
+    same path: rotation happens under a lock file, and a writer whose file
+    was renamed away reopens the path before its next write.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str, maxsize: int = AUDIT_QUEUE_SIZE, batch: int = AUDIT_BATCH,
+                 fsync: str = AUDIT_FSYNC, max_bytes: int = AUDIT_MAX_BYTES,
+                 rotate_seconds: float = AUDIT_ROTATE_SECONDS):
+        self.path = path
+        self.batch = batch
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.written = 0
+        self.sync_writes = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=maxsize)
+        self._file = None
+        self._opened_at = 0.0
+        self._io_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, event: dict):
+        try:
+            self._queue.put(event, timeout=AUDIT_PUT_TIMEOUT)
+        except queue.Full:
+            self.sync_writes += 1
+            self._write_batch([event])
+
+    def flush(self):
+        """Block until everything submitted so far is on disk."""
+        self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        with self._io_lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _run(self):
+        q = self._queue
+        while True:
+            try:
+                items = [q.get(timeout=AUDIT_FLUSH_INTERVAL)]
+            except queue.Empty:
+                continue
+            while len(items) < self.batch:
+                try:
+                    items.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(e is self._STOP for e in items)
+            events = [e for e in items if e is not self._STOP]
+            try:
+                if events:
+                    self._write_batch(events)
+            except Exception:
+                # never let the writer thread die: later events would pile up and flush() hang
+                STATS["dropped"] += len(events)
+                log.exception("audit writer: dropped %d events", len(events))
+            finally:
+                for _ in items:
+                    q.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, events: List[dict]):
+        lines = [_encode(e) for e in events]
+        for attempt in range(2):
+            try:
+                self._write(lines)
+                return
+            except (OSError, ValueError) as e:   # ValueError: write to a closed handle
+                STATS["write_errors"] += 1
+                log.warning("audit writer: batch write to %s failed (%s)", self.path, e)
+                self._reset()   # retry on a fresh handle (rotation race, stale descriptor)
+        # last resort: one plain append per event, dropping only what still fails
+        for line in lines:
+            try:
+                _append(self.path, line)
+                self.written += 1
+            except OSError as e:
+                STATS["dropped"] += 1
+                log.error("audit writer: dropped an event for %s (%s)", self.path, e)
+
+    def _reset(self):
+        with self._io_lock:
+            if self._file:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None
+
+    def _write(self, lines: List[bytes]):
+        data = b"".join(lines)
+        with self._io_lock:
+            f = self._open()
+            f.write(data)
+            f.flush()
+            if self.fsync == "batch":
+                os.fsync(f.fileno())
+            self.written += len(lines)
+
+    def _open(self):
+        if self._file and self._moved():
+            # another process rotated the file: continue in the new one
+            self._file.close()
+            self._file = None
+            STATS["reopened"] += 1
+        if self._file and self._should_rotate():
+            ino = os.fstat(self._file.fileno()).st_ino
+            self._file.close()
+            self._file = None
+            self._rotate(ino)
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "ab")
+            self._opened_at = time.time()
+        return self._file
+
+    def _moved(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _should_rotate(self) -> bool:
+        if self.max_bytes and os.fstat(self._file.fileno()).st_size >= self.max_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self._opened_at >= self.rotate_seconds
+
+    def _rotate(self, ino: int):
+        # one process rotates; the others see the new inode and reopen
+        with open(self.path + ".lock", "ab") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if os.stat(self.path).st_ino != ino:
+                    return   # another process rotated it already
+            except FileNotFoundError:
+                return
+            base = f"{self.path}.{time.strftime('%Y%m%d-%H%M%S')}"
+            target, n = base, 1
+            while os.path.exists(target):
+                target, n = f"{base}.{n}", n + 1
+            os.replace(self.path, target)
+            STATS["rotations"] += 1
+
+
+_writers: Dict[str, AuditWriter] = {}
+_writers_lock = threading.Lock()
+
+def _writer(path: str) -> AuditWriter:
+    w = _writers.get(path)
+    if w is None:
+        with _writers_lock:
+            w = _writers.get(path)
+            if w is None:
+                w = _writers[path] = AuditWriter(path)
+    return w
+
+def stats() -> dict:
+    writers = list(_writers.values())
+    return {**STATS, "written": sum(w.written for w in writers), "sync_writes": sum(w.sync_writes for w in writers),
+            "queued": sum(w._queue.qsize() for w in writers)}
+
+def flush():
+    """Block until every queued event is on disk."""
+    for w in list(_writers.values()):
+        w.flush()
+
+def shutdown():
+    """Flush and stop all background writers (runs at exit)."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for w in writers:
+        w.close()
+
+def _forget_writers():
+    # writer threads do not survive fork; the child starts its own on first event
+    _writers.clear()
+
+atexit.register(shutdown)
+os.register_at_fork(after_in_child=_forget_writers)
+
+def write_event(event: dict, path: str = "logs/audit.log"):
+    event = _stamp(event)
+    if AUDIT_ASYNC:
+        _writer(path).submit(event)
     else:
-        with open(path, "a", encoding="utf-8") as f:
-            f.write(line + "\n")
+        _append(path, _encode(event))
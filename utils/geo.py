@@ -0,0 +1,28 @@
+﻿import math, os
+from array import array
+from typing import Optional, Sequence
+
+EARTH_RADIUS_KM = 6371.0088
+TRAVEL_SPEED_KMH = float(os.getenv("TRAVEL_SPEED_KMH", "20"))   # assumed door-to-door speed
+TRAVEL_DETOUR = float(os.getenv("TRAVEL_DETOUR", "1.3"))         # roads are not straight lines
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def travel_matrix(lats: Sequence[float], lons: Sequence[float],
+                  speed_kmh: float = TRAVEL_SPEED_KMH, detour: float = TRAVEL_DETOUR) -> Optional[array]:
+    """Row-major n x n travel times in whole minutes (rounded up), or None if any
+    point lacks coordinates (NaN)."""
+    n = len(lats)
+    if any(math.isnan(v) for v in lats) or any(math.isnan(v) for v in lons):
+        return None
+    per_km = 60.0 * detour / speed_kmh
+    out = array("i", bytes(4 * n * n))
+    for i in range(n):
+        for j in range(i + 1, n):
+            m = math.ceil(haversine_km(lats[i], lons[i], lats[j], lons[j]) * per_km)
+            out[i * n + j] = out[j * n + i] = m
+    return out
@@ -1,37 +1,133 @@
-﻿import os
-from typing import Optional
+﻿import hashlib, json, logging, os, re, threading, time
+from collections import Counter
+from typing import Iterator, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from utils.cache import TTLCache, DiskCache
+
+log = logging.getLogger(__name__)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "8"))                  # seconds per upstream call, in total
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))    # in-flight calls per process
+LLM_QUEUE_WAIT = float(os.getenv("LLM_QUEUE_WAIT", "0"))            # wait for a free slot before falling back
+PROMPT_VERSION = "1"  # bump whenever the rewrite prompt below changes
 
-def polish_text(text: str, max_len: int = 600) -> str:
-    if not text:
-        return text
-    if OPENAI_API_KEY:
+STATS = Counter()  # llm_calls, fallback_busy, fallback_timeout, fallback_error
+
+# ---------- response cache (memory LRU/TTL, optional SQLite tier) ----------
+CACHE = TTLCache(maxsize=int(os.getenv("LLM_CACHE_SIZE", "1024")),
+                 ttl=float(os.getenv("LLM_CACHE_TTL", "86400")))
+_DISK_PATH = os.getenv("LLM_CACHE_PATH")
+DISK_CACHE: Optional[DiskCache] = (
+    DiskCache(_DISK_PATH, ttl=float(os.getenv("LLM_CACHE_TTL", "86400"))) if _DISK_PATH else None
+)
+
+def _cache_key(text: str, max_len: int) -> str:
+    raw = f"{LLM_MODEL}\0{PROMPT_VERSION}\0{max_len}\0{text}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def cache_stats() -> dict:
+    return {"memory": CACHE.stats(), "disk": DISK_CACHE.stats() if DISK_CACHE else None}
+
+def stats() -> dict:
+    return {**STATS, "cache": cache_stats()}
+
+# ---------- pooled upstream client ----------
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+def _forget_session():
+    # pooled sockets must not be shared with a forked worker
+    global _session
+    _session = None
+
+os.register_at_fork(after_in_child=_forget_session)
+
+class LLMBusy(Exception):
+    """All concurrency slots are taken; the caller should use the local formatter."""
+
+def _client() -> requests.Session:
+    """Process-wide HTTP session; keeps connections (and TLS sessions) alive between calls."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_MAX_CONCURRENCY, max_retries=0)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                s.headers["Authorization"] = f"Bearer {OPENAI_API_KEY}"
+                _session = s
+    return _session
+
+def _messages(text: str) -> list:
+    prompt = (
+        "Rewrite as a professional, friendly tour guide.\n"
+        "Output style:\n"
+        "- Start with a one-sentence answer.\n"
+        "- Then 3–6 short bullets with the most useful facts/details.\n"
+        "- If it is an itinerary, use a numbered list with minute estimates.\n"
+        "- Keep it concise, specific, and free of filler or marketing fluff.\n"
+        "- Use simple Markdown only (bold, bullets, numbered lists).\n"
+        f"Text to rewrite:\n{text}"
+    )
+    return [{"role":"system","content":"You are a concise, professional tour guide who writes brief, structured answers."},
+            {"role":"user","content":prompt}]
+
+def _body(res: requests.Response, deadline: float) -> Iterator[bytes]:
+    """Yield the response body as it arrives; requests.Timeout once `deadline` (monotonic) passes.
+
+    requests' timeout applies to each socket read, so a server that trickles
+    bytes could otherwise hold a call open indefinitely."""
+    raw = res.raw
+    while True:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise requests.Timeout(f"no complete reply within {LLM_TIMEOUT:g}s")
+        conn = raw.connection
+        if conn is not None and conn.sock is not None:
+            conn.sock.settimeout(left)
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=OPENAI_API_KEY)
-            prompt = (
-                "Rewrite as a professional, friendly tour guide.\n"
-                "Output style:\n"
-                "- Start with a one-sentence answer.\n"
-                "- Then 3–6 short bullets with the most useful facts/details.\n"
-                "- If it is an itinerary, use a numbered list with minute estimates.\n"
-                "- Keep it concise, specific, and free of filler or marketing fluff.\n"
-                "- Use simple Markdown only (bold, bullets, numbered lists).\n"
-                f"Text to rewrite:\n{text}"
-            )
-            res = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role":"system","content":"You are a concise, professional tour guide who writes brief, structured answers."},
-                          {"role":"user","content":prompt}],
-                max_tokens=260,
-                temperature=0.15,
-            )
-            out = res.choices[0].message.content.strip()
-            return out[:max_len]
-        except Exception:
-            pass
-    import re
+            chunk = raw.read1(16384, decode_content=True)
+        except ReadTimeoutError as e:
+            raise requests.Timeout(e) from e
+        if not chunk:
+            return
+        yield chunk
+
+def _lines(chunks: Iterator[bytes]) -> Iterator[str]:
+    buf = b""
+    for chunk in chunks:
+        *lines, buf = (buf + chunk).split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if buf:
+        yield buf.decode("utf-8")
+
+def _llm_rewrite(text: str, max_len: int) -> str:
+    if not _slots.acquire(timeout=LLM_QUEUE_WAIT):
+        raise LLMBusy()
+    try:
+        STATS["llm_calls"] += 1
+        deadline = time.monotonic() + LLM_TIMEOUT
+        with _client().post(
+            f"{OPENAI_BASE_URL}/chat/completions",
+            json={"model": LLM_MODEL, "messages": _messages(text), "max_tokens": 260, "temperature": 0.15},
+            timeout=LLM_TIMEOUT, stream=True,
+        ) as res:
+            res.raise_for_status()
+            body = b"".join(_body(res, deadline))
+        out = json.loads(body)["choices"][0]["message"]["content"].strip()
+    finally:
+        _slots.release()
+    return out[:max_len]
+
+def _fallback(text: str, max_len: int) -> str:
     # Fallback: compact text and emulate a brief professional tone
     t = re.sub(r"\s+", " ", (text or "").strip())
     # Keep first 1–2 sentences as lead
@@ -40,6 +136,100 @@ def polish_text(text: str, max_len: int = 600) -> str:
     rest = " ".join(sents[2:])
     # Try to bulletize obvious list-like fragments
     items = re.split(r";|\s-\s|\n|,\s(?=[A-Z])", rest)
-    bullets = [f"- {re.sub(r'\s+', ' ', i).strip()}" for i in items if i and len(i.strip()) > 3][:5]
+    bullets = ["- " + re.sub(r"\s+", " ", i).strip() for i in items if i and len(i.strip()) > 3][:5]
     compact = (lead + ("\n" + "\n".join(bullets) if bullets else "")).strip()
     return compact[:max_len]
+
+def _cached(key: str) -> Optional[str]:
+    out = CACHE.get(key)
+    if out is None and DISK_CACHE is not None:
+        out = DISK_CACHE.get(key)
+        if out is not None:
+            CACHE.set(key, out)
+    return out
+
+def _store(key: str, out: str):
+    CACHE.set(key, out)
+    if DISK_CACHE is not None:
+        DISK_CACHE.set(key, out)
+
+def polish_text(text: str, max_len: int = 600) -> str:
+    if not text:
+        return text
+    if OPENAI_API_KEY:
+        key = _cache_key(text, max_len)
+        out = _cached(key)
+        if out is not None:
+            return out
+        try:
+            out = _llm_rewrite(text, max_len)
+        except LLMBusy:
+            STATS["fallback_busy"] += 1
+        except requests.Timeout:
+            STATS["fallback_timeout"] += 1
+        except Exception as e:
+            STATS["fallback_error"] += 1
+            log.warning("LLM rewrite failed, using local formatter: %s", e)
+        if out is not None:
+            _store(key, out)
+            return out
+    return _fallback(text, max_len)
+
+def polish_stream(text: str, max_len: int = 600) -> Iterator[str]:
+    """Streaming `polish_text`: yields the rewrite so far as tokens arrive.
+
+    The last value yielded is the final text (the local formatter's output if
+    the upstream call is busy, fails part-way or does not finish within
+    LLM_TIMEOUT)."""
+    if not text:
+        return
+    if not OPENAI_API_KEY:
+        yield _fallback(text, max_len)
+        return
+    key = _cache_key(text, max_len)
+    out = _cached(key)
+    if out is not None:
+        yield out
+        return
+    if not _slots.acquire(timeout=LLM_QUEUE_WAIT):
+        STATS["fallback_busy"] += 1
+        yield _fallback(text, max_len)
+        return
+    out, failed = "", False
+    try:
+        STATS["llm_calls"] += 1
+        deadline = time.monotonic() + LLM_TIMEOUT
+        with _client().post(
+            f"{OPENAI_BASE_URL}/chat/completions",
+            json={"model": LLM_MODEL, "messages": _messages(text), "max_tokens": 260,
+                  "temperature": 0.15, "stream": True},
+            timeout=LLM_TIMEOUT, stream=True,
+        ) as res:
+            res.raise_for_status()
+            for line in _lines(_body(res, deadline)):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                delta = (json.loads(data)["choices"][0].get("delta") or {}).get("content")
+                if delta:
+                    out += delta
+                    yield out.lstrip()[:max_len]
+                    if len(out.lstrip()) >= max_len:
+                        break
+    except requests.Timeout:
+        STATS["fallback_timeout"] += 1
+        failed = True
+    except Exception as e:
+        STATS["fallback_error"] += 1
+        log.warning("LLM stream failed, using local formatter: %s", e)
+        failed = True
+    finally:
+        _slots.release()
+    out = out.strip()[:max_len]
+    if failed or not out:
+        yield _fallback(text, max_len)
+        return
+    _store(key, out)
+    yield out
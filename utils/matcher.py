@@ -0,0 +1,105 @@
+﻿from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher.
+
+    One left-to-right pass over the text reports every occurrence of every
+    pattern, overlapping ones included. Empty patterns are ignored.
+    """
+
+    __slots__ = ("_goto", "_fail", "_out")
+
+    def __init__(self, patterns: Iterable[Tuple[str, Any]] = ()):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Any]] = [[]]
+        for pattern, value in patterns:
+            self._add(pattern, value)
+        self._build()
+
+    def _add(self, pattern: str, value: Any):
+        if not pattern:
+            return
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(value)
+
+    def _build(self):
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        while queue:
+            u = queue.popleft()
+            for ch, v in goto[u].items():
+                queue.append(v)
+                f = fail[u]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[v] = goto[f].get(ch, 0) if u else 0
+                if out[fail[v]]:
+                    out[v] = out[v] + out[fail[v]]
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, Any]]:
+        """Yield (end_index, value) for each pattern occurrence in `text`."""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for value in out[node]:
+                yield i, value
+
+    def values(self, text: str) -> set:
+        """Set of values whose pattern occurs anywhere in `text`."""
+        return {v for _, v in self.finditer(text)}
+
+
+class SubstitutionTrie:
+    """Word set where each character may also be written as a substitute.
+
+    `char_map` maps a character to every single-character spelling it may take
+    (e.g. "a" -> ("a", "@", "4")), so "b@d" is in a trie built from "bad".
+    """
+
+    _END = ""
+
+    def __init__(self, words: Iterable[str], char_map: Dict[str, Tuple[str, ...]]):
+        self._root: Dict[str, Any] = {}
+        for word in words:
+            node = self._root
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[self._END] = True
+        # written character -> original characters it can stand for
+        self._rev: Dict[str, Tuple[str, ...]] = {}
+        for orig, subs in char_map.items():
+            for sub in subs:
+                self._rev[sub] = self._rev.get(sub, ()) + (orig,)
+        for sub in list(self._rev):
+            if sub not in char_map and sub not in self._rev[sub]:
+                self._rev[sub] += (sub,)
+
+    def __contains__(self, text: str) -> bool:
+        nodes = [self._root]
+        rev = self._rev
+        for ch in text:
+            nxt = []
+            for node in nodes:
+                for orig in rev.get(ch, (ch,)):
+                    child = node.get(orig)
+                    if child is not None:
+                        nxt.append(child)
+            if not nxt:
+                return False
+            nodes = nxt
+        return any(self._END in node for node in nodes)
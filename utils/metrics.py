@@ -0,0 +1,200 @@
+﻿"""In-process metrics: per-stage latency histograms, counters, Prometheus text output,
+and an opt-in sampling profiler.
+
+    with metrics.timer("vtg_stage_seconds", stage="plan"): ...
+    check_input = metrics.timed("vtg_stage_seconds", stage="check_input")(check_input)
+    metrics.inc("vtg_safety_blocks_total", kind="input")
+
+With METRICS=0 `timed` returns the function unchanged and `timer` returns a
+shared no-op context, so instrumentation costs close to nothing.
+"""
+import os, sys, threading, time
+from bisect import bisect_left
+from collections import Counter
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+ENABLED = os.getenv("METRICS", "1") not in ("0", "false", "no")
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, str, str, Dict[str, Any], float]   # name, type, help, labels, value
+
+_help: Dict[str, Tuple[str, str]] = {}        # name -> (type, help)
+_hists: Dict[Tuple[str, Labels], "Histogram"] = {}
+_counters: Dict[Tuple[str, Labels], float] = {}
+_collectors: List[Callable[[], Iterable[Sample]]] = []
+_lock = threading.Lock()
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        i = bisect_left(BUCKETS, seconds)   # first bucket with le >= seconds
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+            self.count += 1
+
+
+def describe(name: str, kind: str, help: str):
+    _help[name] = (kind, help)
+
+def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Labels]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def histogram(name: str, **labels) -> Histogram:
+    key = _key(name, labels)
+    h = _hists.get(key)
+    if h is None:
+        with _lock:
+            h = _hists.setdefault(key, Histogram())
+    return h
+
+def observe(name: str, seconds: float, **labels):
+    if ENABLED:
+        histogram(name, **labels).observe(seconds)
+
+def inc(name: str, value: float = 1, **labels):
+    if ENABLED:
+        key = _key(name, labels)
+        with _lock:
+            _counters[key] = _counters.get(key, 0) + value
+
+
+class _Timer:
+    __slots__ = ("hist", "t0")
+
+    def __init__(self, hist: Histogram):
+        self.hist = hist
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0)
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopTimer()
+
+def timer(name: str, **labels):
+    """Context manager that records the elapsed seconds into a histogram."""
+    return _Timer(histogram(name, **labels)) if ENABLED else _NOOP
+
+def timed(name: str, **labels):
+    """Decorator form of `timer`; a no-op (returns `fn` itself) when disabled."""
+    def deco(fn):
+        if not ENABLED:
+            return fn
+        hist = histogram(name, **labels)
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - t0)
+        return wrapper
+    return deco
+
+def register_collector(fn: Callable[[], Iterable[Sample]]):
+    """`fn` is called on every scrape and yields (name, type, help, labels, value)."""
+    _collectors.append(fn)
+
+
+# ---------- Prometheus text exposition ----------
+def _escape(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(labels, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _num(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+def render() -> str:
+    lines: List[str] = []
+    families: Dict[str, List[str]] = {}
+    types: Dict[str, Tuple[str, str]] = {}
+    for (name, labels), h in sorted(_hists.items()):
+        types.setdefault(name, _help.get(name, ("histogram", name)))
+        out = families.setdefault(name, [])
+        cum = 0
+        for le, n in zip(BUCKETS + (float("inf"),), h.counts):
+            cum += n
+            bound = 'le="%s"' % ("+Inf" if le == float("inf") else repr(le))
+            out.append(f"{name}_bucket{_fmt_labels(labels, bound)} {cum}")
+        out.append(f"{name}_sum{_fmt_labels(labels)} {h.sum!r}")
+        out.append(f"{name}_count{_fmt_labels(labels)} {h.count}")
+    for (name, labels), v in sorted(_counters.items()):
+        types.setdefault(name, _help.get(name, ("counter", name)))
+        families.setdefault(name, []).append(f"{name}{_fmt_labels(labels)} {_num(v)}")
+    for collect in _collectors:
+        for name, kind, help, labels, v in collect():
+            types.setdefault(name, (kind, help))
+            families.setdefault(name, []).append(f"{name}{_fmt_labels(sorted(labels.items()))} {_num(v)}")
+    for name, samples in families.items():
+        kind, help = types[name]
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+# ---------- sampling profiler ----------
+class SamplingProfiler:
+    """Samples one thread's Python stack every `interval` seconds from a helper
+    thread; `collapsed()` gives flamegraph-style "a;b;c count" lines. Under the
+    GIL the effective rate is bounded by sys.getswitchinterval() (5 ms default)."""
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.001):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
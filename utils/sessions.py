@@ -0,0 +1,114 @@
+﻿"""Server-side sessions: the cookie carries only an opaque random ID.
+
+    SESSION_STORE=memory   in-process LRU with TTL (the default for `python app.py`)
+    SESSION_STORE=sqlite   SQLite file at SESSION_PATH, shared by every worker process
+    SESSION_STORE=cookie   Flask's default signed-cookie session
+
+The memory store is private to one process: under a multi-process server each
+worker would have its own sessions and lose them when it restarts. serve.py
+therefore defaults to sqlite; set it explicitly for gunicorn and the like.
+
+A session expires after SESSION_TTL seconds without a request that uses it:
+reads restart the TTL as well as writes.
+
+Any object with `get(key)`, `set(key, value)` and `pop(key)` can be a store,
+plus optionally `touch(key, slack)` to restart a TTL without rewriting the
+data; `utils.cache.TTLCache` and `utils.cache.DiskCache` are the two shipped
+ones. Session data must be JSON-serializable.
+"""
+import copy, os, secrets, threading
+from typing import Any, Optional
+from flask import Flask
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from utils.cache import DiskCache, TTLCache
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")                # per process; see above
+SESSION_PATH = os.getenv("SESSION_PATH", "data/sessions.sqlite3")
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(24 * 3600)))    # idle seconds before a session expires
+SESSION_MAX = int(os.getenv("SESSION_MAX", "100000"))            # memory store capacity (LRU beyond)
+PURGE_EVERY = 1000                                                # saves between expired-row sweeps
+TOUCH_SLACK = min(60.0, SESSION_TTL / 10)                         # expiry drift allowed before a read rewrites it
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial: Optional[dict] = None, sid: Optional[str] = None, new: bool = False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps session data in `store`, keyed by the ID in the session cookie.
+
+    Unknown or expired IDs get a fresh session with a new ID (a client can
+    never pick its own). Data is written back only when the request changed it;
+    otherwise the store just restarts the session's TTL.
+    """
+
+    def __init__(self, store: Any):
+        self.store = store
+        # in-process stores hand out the stored object itself; copy so requests never share state
+        self._copy = isinstance(store, TTLCache)
+        self._saves = 0
+        self._lock = threading.Lock()
+
+    def open_session(self, app: Flask, request) -> ServerSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.get(sid)
+            if data is not None:
+                return ServerSession(copy.deepcopy(data) if self._copy else data, sid=sid)
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app: Flask, session: ServerSession, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified and not session.new:
+                self.store.pop(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if session.modified:
+            data = dict(session)
+            self.store.set(session.sid, copy.deepcopy(data) if self._copy else data)
+            self._maybe_purge()
+        elif not session.new:
+            touch = getattr(self.store, "touch", None)
+            if touch is not None:
+                touch(session.sid, TOUCH_SLACK)
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+            response.vary.add("Cookie")
+
+    def _maybe_purge(self):
+        purge = getattr(self.store, "purge", None)
+        if purge is None:
+            return
+        with self._lock:
+            self._saves += 1
+            due = self._saves % PURGE_EVERY == 0
+        if due:
+            purge()
+
+
+def make_store(kind: str = SESSION_STORE, path: str = SESSION_PATH, ttl: float = SESSION_TTL):
+    if kind == "memory":
+        return TTLCache(maxsize=SESSION_MAX, ttl=ttl)
+    if kind == "sqlite":
+        return DiskCache(path, ttl=ttl)
+    raise ValueError(f"unknown session store {kind!r}; expected memory, sqlite or cookie")
+
+
+def init_app(app: Flask, kind: str = SESSION_STORE):
+    """Install the server-side session interface on `app` (no-op for "cookie")."""
+    if kind != "cookie":
+        app.session_interface = ServerSessionInterface(make_store(kind))
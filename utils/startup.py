@@ -0,0 +1,142 @@
+﻿"""Deferred initialization and a cold-start timing report.
+
+Expensive module state (the admin password hash, the profanity matcher, the
+catalogue and its indexes) is wrapped in `Lazy` and built on first use. The
+app then either warms everything in a background thread right after import
+(STARTUP_MODE=background, the default), does it before serving
+(STARTUP_MODE=eager), or leaves it to the first requests (STARTUP_MODE=lazy).
+A request that needs a value while the warm-up is still building it waits for
+that build instead of starting a second one.
+
+With STARTUP_REPORT=1, importing this module first also times every module
+imported after it; `report()` returns import and init costs, and
+`print_report()` writes them to stderr.
+"""
+import builtins, os, sys, threading, time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")   # background | eager | lazy
+STARTUP_REPORT = os.getenv("STARTUP_REPORT", "0") in ("1", "true", "yes")
+
+T0 = time.perf_counter()
+_inits: List[Tuple[str, float, str]] = []                 # (name, seconds, thread)
+_imports: List[Tuple[str, float, float]] = []             # (module, cumulative s, self s)
+_steps: List[Tuple[str, float, bool]] = []                # warm-up (name, seconds, ok)
+_phases: Dict[str, float] = {}
+_ready = threading.Event()
+
+
+def record(name: str, seconds: float):
+    _inits.append((name, seconds, threading.current_thread().name))
+
+
+_UNSET = object()
+
+class Lazy:
+    """A value built once, on first `get()`, by whichever thread asks first."""
+
+    __slots__ = ("name", "_build", "_value", "_lock")
+
+    def __init__(self, name: str, build: Callable[[], Any]):
+        self.name = name
+        self._build = build
+        self._value = _UNSET
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        value = self._value
+        if value is _UNSET:
+            with self._lock:
+                value = self._value
+                if value is _UNSET:
+                    t0 = time.perf_counter()
+                    value = self._value = self._build()
+                    record(self.name, time.perf_counter() - t0)
+        return value
+
+    @property
+    def ready(self) -> bool:
+        return self._value is not _UNSET
+
+
+def warm_up(steps: Iterable[Tuple[str, Callable[[], Any]]]):
+    """Run each (name, fn) in order, timing it; failures are recorded, not raised
+    (the first real use retries and raises)."""
+    t0 = time.perf_counter()
+    for name, fn in steps:
+        t, ok = time.perf_counter(), True
+        try:
+            fn()
+        except Exception:
+            ok = False
+        _steps.append((name, time.perf_counter() - t, ok))
+    _phases["warm_up"] = time.perf_counter() - t0
+    _ready.set()
+
+
+def start(steps: Iterable[Tuple[str, Callable[[], Any]]], mode: str = STARTUP_MODE) -> Optional[threading.Thread]:
+    """Apply STARTUP_MODE to the warm-up `steps`."""
+    steps = list(steps)
+    if mode == "eager":
+        warm_up(steps)
+    elif mode == "background":
+        t = threading.Thread(target=warm_up, args=(steps,), name="warm-up", daemon=True)
+        t.start()
+        return t
+    else:
+        _ready.set()
+    return None
+
+
+def mark(phase: str):
+    """Note the time since process start (e.g. "app_imported")."""
+    _phases[phase] = time.perf_counter() - T0
+
+
+def wait_ready(timeout: Optional[float] = None) -> bool:
+    return _ready.wait(timeout)
+
+
+def report() -> Dict[str, Any]:
+    return {
+        "mode": STARTUP_MODE,
+        "phases_ms": {k: round(v * 1000, 2) for k, v in _phases.items()},
+        "warm_up_ms": [(n, round(s * 1000, 2), ok) for n, s, ok in _steps],
+        "inits_ms": [(n, round(s * 1000, 2), th) for n, s, th in _inits],
+        "imports_ms": sorted(((m, round(c * 1000, 2), round(s * 1000, 2)) for m, c, s in _imports),
+                             key=lambda r: -r[2])[:25],
+    }
+
+
+def print_report(file=None):
+    r = report()
+    out = file or sys.stderr
+    print(f"startup ({r['mode']}): " + ", ".join(f"{k} {v} ms" for k, v in r["phases_ms"].items()), file=out)
+    for name, ms, ok in r["warm_up_ms"]:
+        print(f"  warm   {name:<32} {ms:9.2f} ms{'' if ok else '  FAILED'}", file=out)
+    for name, ms, thread in r["inits_ms"]:
+        print(f"  init   {name:<32} {ms:9.2f} ms  [{thread}]", file=out)
+    for mod, cum, self_ms in r["imports_ms"]:
+        print(f"  import {mod:<32} {self_ms:9.2f} ms self  {cum:9.2f} ms total", file=out)
+
+
+# ---------- import timing (STARTUP_REPORT=1) ----------
+_orig_import = builtins.__import__
+_stack: List[float] = []
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return _orig_import(name, globals, locals, fromlist, level)
+    t0 = time.perf_counter()
+    _stack.append(0.0)
+    try:
+        return _orig_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - t0
+        nested = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        _imports.append((name, elapsed, elapsed - nested))
+
+if STARTUP_REPORT:
+    builtins.__import__ = _timed_import